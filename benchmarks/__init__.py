@@ -0,0 +1,7 @@
+"""Throughput benchmarks for building, creating and cleaning up documents.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.run
+
+See `benchmarks.run` for the options."""
@@ -0,0 +1,78 @@
+from monufacture import factory, default, document, trait, fragment, embed
+from monufacture.helpers import (id_of, sequence, random_text, one_of,
+                                 random_number, list_of, now, object_id,
+                                 dependent)
+
+"""Representative factories for the benchmarks, one per shape of
+declaration: flat documents, deep document inheritance, heavy use of
+traits, embedded lists of fragments, chains of id_of dependencies and a
+mix of the value helpers."""
+
+FACTORIES = ["flat", "deep", "traits", "embedded", "chain", "helpers"]
+
+# The document built from each factory.
+DOCUMENTS = {
+    "flat": None,
+    "deep": "level_6",
+    "traits": "everything",
+    "embedded": None,
+    "chain": None,
+    "helpers": None
+}
+
+
+def declare(collection_for):
+    """Declares the benchmark factories, taking each one's collection from
+    `collection_for(name)`."""
+
+    with factory("flat", collection_for("flat")):
+        default(dict(("field_%d" % i, "value %d" % i) for i in range(20)))
+
+    with factory("deep", collection_for("deep")):
+        default({"level": 0, "name": "base", "tags": ["a", "b"]})
+        parent = "default"
+        for level in range(1, 7):
+            name = "level_%d" % level
+            document(name, {"level": level, "field_%d" % level: lambda doc: doc["level"] * 2},
+                     parent=parent)
+            parent = name
+
+    with factory("traits", collection_for("traits")):
+        default({"name": "base"})
+        names = []
+        for i in range(8):
+            name = "trait_%d" % i
+            trait(name, {"flag_%d" % i: True, "value_%d" % i: lambda doc: doc["name"]})
+            names.append(name)
+        document("everything", parent="default", traits=names)
+
+    with factory("embedded", collection_for("embedded")):
+        fragment("address", {
+            "street": "1 Main St",
+            "city": "Springfield",
+            "zip": lambda doc: "12345",
+            "location": {"type": "Point", "coordinates": [0.0, 0.0]}
+        })
+        default({"name": "Homer", "addresses": list_of(embed("address"), 10)})
+
+    with factory("chain_root", collection_for("chain_root")):
+        default({"name": "root"})
+
+    with factory("chain_middle", collection_for("chain_middle")):
+        default({"name": "middle", "root_id": id_of("chain_root")})
+
+    with factory("chain", collection_for("chain")):
+        default({"name": "leaf", "middle_id": id_of("chain_middle"),
+                 "root_id": id_of("chain_root")})
+
+    with factory("helpers", collection_for("helpers")):
+        default({
+            "number": sequence(),
+            "username": sequence(lambda n: "user%d" % n),
+            "token": random_text(length=32),
+            "kind": one_of("a", "b", "c"),
+            "score": random_number(100),
+            "created": now(),
+            "ref": object_id(),
+            "summary": dependent(lambda doc: "%s (%s)" % (doc["username"], doc["kind"]))
+        })
@@ -0,0 +1,280 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+"""Runs the benchmarks and compares them with a stored baseline.
+
+Each benchmark runs `--repeat` times, each time in a child process of
+its own so factory state and peak memory don't leak from one run to the
+next, and reports the best of the runs for each of:
+
+  docs/sec     documents built, created or cleaned up per second.
+  relative     docs/sec multiplied by the time taken by a fixed calibration
+               workload run just beforehand, i.e. documents per unit of
+               machine speed, which holds steadier between runs.
+  objects/doc  GC-tracked objects still alive per document once the
+               documents have been produced (with collection disabled);
+               catches leaks and bloated documents or bookkeeping.
+  peak kb      growth in the child's peak resident set size.
+
+Results are compared with `baseline.json`; a benchmark regresses when
+relative throughput falls, or objects/doc or peak kb rises, by more than the
+threshold. The exit status is 1 if anything regressed. Use `--save` to
+record a new baseline after an intended change. Timings are only
+comparable between runs on the same machine, so regenerate the baseline
+before relying on the comparison elsewhere.
+
+By default documents are written to in-memory collections (see
+`monufacture.memory`); pass `--mongo` to use a real mongod instead.
+"""
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (result key, label, direction in which the metric worsens)
+METRICS = [("docs_per_sec", "docs/sec", -1), ("relative", "relative", -1),
+           ("objects_per_doc", "objects/doc", 1), ("peak_kb", "peak kb", 1)]
+
+# The metrics compared with the baseline. Raw docs/sec varies too much with
+# the load on the machine, so throughput is compared using `relative`.
+COMPARED = ["relative", "objects_per_doc", "peak_kb"]
+
+
+def _collections(mongo):
+    """Returns a function providing the collection for each factory."""
+    if mongo:
+        from pymongo import MongoClient
+        db = MongoClient(mongo)["monufacture_benchmarks"]
+        return lambda name: db[name]
+
+    from monufacture import MemoryCollection
+    return lambda name: MemoryCollection(name, "benchmarks")
+
+
+def _build(factory_name, document_name):
+    import monufacture
+    return lambda count: monufacture.build_list(count, factory_name, document_name)
+
+
+def _create(factory_name, document_name):
+    import monufacture
+    return lambda count: monufacture.create_list(count, factory_name, document_name)
+
+
+def _create_bulk(factory_name, document_name):
+    import monufacture
+    return lambda count: monufacture.create_list(count, factory_name, document_name, bulk_=True)
+
+
+def _encode(factory_name, document_name):
+    # Build then encode each document as insert_many would, to compare with
+    # build_raw. MemoryCollection decodes raw documents, hiding the saving.
+    import monufacture
+    import bson
+
+    def run(count):
+        for doc in monufacture.iter_build(count, factory_name, document_name):
+            doc.setdefault("_id", bson.ObjectId())
+            bson.BSON.encode(doc)
+    return run
+
+
+def _build_raw(factory_name, document_name):
+    import monufacture
+    return lambda count: [monufacture.build_raw(factory_name, document_name)
+                          for x in xrange(count)]
+
+
+def _cleanup(factory_name, document_name):
+    import monufacture
+
+    def run(count):
+        monufacture.cleanup()
+    run.setup = lambda count: monufacture.create_list(count, factory_name, document_name,
+                                                      bulk_=True)
+    return run
+
+
+# (name, benchmark, factory, number of documents)
+BENCHMARKS = [
+    ("build_flat", _build, "flat", 20000),
+    ("build_deep", _build, "deep", 20000),
+    ("build_traits", _build, "traits", 20000),
+    ("build_embedded", _build, "embedded", 5000),
+    ("build_helpers", _build, "helpers", 20000),
+    ("create_flat", _create, "flat", 10000),
+    ("create_chain", _create, "chain", 3000),
+    ("create_bulk_flat", _create_bulk, "flat", 20000),
+    ("create_bulk_embedded", _create_bulk, "embedded", 5000),
+    ("encode_flat", _encode, "flat", 20000),
+    ("encode_embedded", _encode, "embedded", 5000),
+    ("build_raw_flat", _build_raw, "flat", 20000),
+    ("build_raw_embedded", _build_raw, "embedded", 5000),
+    ("cleanup_flat", _cleanup, "flat", 50000),
+]
+
+
+def _peak_kb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def calibrate(repeat=5):
+    """Times a fixed pure-Python workload resembling building a document,
+    used to normalise throughput for the speed of the machine. The fastest
+    of several short runs is used, as the least disturbed by other load."""
+    times = []
+    for attempt in range(repeat):
+        start = time.time()
+        for i in xrange(10000):
+            doc = {}
+            for key in ("a", "b", "c", "d", "e"):
+                doc[key] = [key, i]
+            dict(doc)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def measure(benchmark, factory_name, count, mongo=None):
+    """Runs a single benchmark in the current process, returning its
+    metrics. The benchmark factories and documents are removed again and
+    the module-level settings restored afterwards."""
+    import monufacture
+    from benchmarks.factories import declare, DOCUMENTS
+
+    read_back = monufacture.read_back
+    existing = set(monufacture.factories)
+    monufacture.read_back = False
+    try:
+        declare(_collections(mongo))
+        run = benchmark(factory_name, DOCUMENTS[factory_name])
+        if hasattr(run, "setup"):
+            run.setup(count)
+
+        speed = calibrate()
+        gc.collect()
+        gc.disable()
+        objects = len(gc.get_objects())
+        peak = _peak_kb()
+        start = time.time()
+        result = run(count)
+        elapsed = time.time() - start
+        objects = len(gc.get_objects()) - objects
+        peak = _peak_kb() - peak
+        del result
+    finally:
+        gc.enable()
+        monufacture.cleanup()
+        for name in set(monufacture.factories) - existing:
+            del monufacture.factories[name]
+            monufacture.modules.pop(name, None)
+        monufacture.read_back = read_back
+
+    return {"docs_per_sec": count / elapsed, "relative": speed * count / elapsed,
+            "objects_per_doc": float(objects) / count,
+            "peak_kb": peak}
+
+
+def _child(queue, *args):
+    try:
+        queue.put(measure(*args))
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+
+def run_isolated(benchmark, factory_name, count, mongo=None):
+    """Runs a single benchmark in a child process, returning its metrics."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child,
+                                      args=(queue, benchmark, factory_name, count, mongo))
+    process.start()
+    result = queue.get()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+def run_best(benchmark, factory_name, count, mongo=None, repeat=5):
+    """Runs a benchmark `repeat` times, returning the best result seen for
+    each metric to reduce the noise from other activity on the machine."""
+    runs = [run_isolated(benchmark, factory_name, count, mongo) for i in range(repeat)]
+    best = {}
+    for metric, label, direction in METRICS:
+        values = [result[metric] for result in runs]
+        best[metric] = max(values) if direction < 0 else min(values)
+    return best
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of (benchmark, metric, baseline, result) tuples for
+    every metric which is worse than the baseline by more than
+    `threshold` (a fraction)."""
+    regressions = []
+    for name, result in sorted(results.iteritems()):
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric, label, direction in METRICS:
+            if metric not in COMPARED or expected.get(metric) is None:
+                continue
+            # Ignore peak memory changes smaller than a page or two of noise.
+            floor = 64 if metric == "peak_kb" else 0
+            change = (result[metric] - expected[metric]) * direction
+            if change > max(abs(expected[metric]) * threshold, floor):
+                regressions.append((name, label, expected[metric], result[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the monufacture benchmarks.")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default all)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply the number of documents by this factor")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fraction by which a metric may worsen (default 0.25)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each benchmark, keeping the best (default 5)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument("--save", action="store_true", help="save results as the baseline")
+    parser.add_argument("--mongo", metavar="URI", help="use the given mongod")
+    args = parser.parse_args(argv)
+
+    selected = [b for b in BENCHMARKS if not args.names or b[0] in args.names]
+
+    results = {}
+    row_format = "%-24s %12s %10s %12s %10s\n"
+    sys.stdout.write(row_format % ("benchmark", "docs/sec", "relative", "objects/doc", "peak kb"))
+    for name, benchmark, factory_name, count in selected:
+        count = max(1, int(count * args.scale))
+        result = results[name] = run_best(benchmark, factory_name, count, args.mongo,
+                                                args.repeat)
+        sys.stdout.write(row_format % (name, "%.0f" % result["docs_per_sec"],
+                                       "%.1f" % result["relative"],
+                                       "%.2f" % result["objects_per_doc"], result["peak_kb"]))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, label, expected, actual in regressions:
+        sys.stdout.write("REGRESSION %s %s: %.2f -> %.2f\n" % (name, label, expected, actual))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
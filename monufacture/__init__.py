@@ -1,20 +1,55 @@
-from factory import Factory, Trait
+from factory import Factory, Trait, BulkCreateException
+from strategies import TrackedIdsStrategy, DeleteAllStrategy, DropStrategy
+from rng import seed
+from graph import deferred
+from buffer import WriteBuffer
+from profiler import profiling, Profiler
+from memory import MemoryCollection, MemoryDatabase
+from snapshot import dataset
+from exporter import export, Exporter
+import discovery
+import databases
 from contextlib import contextmanager
-from threading import local
+from importlib import import_module
+from threading import local, RLock
 import logging
+import sys
+import time
+from weakref import WeakSet
 
 # Registry for all factories
 factories = {}
+modules = {}
+registry = {}
+import_times = []
+discovery_time = 0.0
 traits = {}
+dirty = set()
+pools = WeakSet()
+write_buffer = None
+memory = None
+id_spill_bytes = None
 debug = False
+read_back = True
+cleanup_strategy = TrackedIdsStrategy()
 local = local()
 
+# The real collections of factories swapped to memory by in_memory().
+_swapped = {}
+
+_load_lock = RLock()
+
 # Methods to setup and declare factories
 @contextmanager
 def factory(name, collection=None):
     """Declares a new named factory with the given attributes."""
-    factory = Factory(collection, global_traits=traits)
+    factory = Factory(collection, global_traits=traits, dirty=dirty, name=name)
+    factory.write_buffer = write_buffer
+    factory.id_spill_bytes = id_spill_bytes
+    if memory is not None:
+        _swap_to_memory(factory)
     factories[name] = factory
+    modules[name] = sys._getframe(2).f_globals.get("__name__")
 
     # Set the context for other methods
     local.working_factory = factory
@@ -23,8 +58,75 @@ def factory(name, collection=None):
 
 
 def get_factory(name):
-    """Get a factory by name"""
-    return factories[name]
+    """Get a factory by name, first importing the module registered as
+    declaring it if it hasn't been declared yet."""
+    factory = factories.get(name)
+    if factory is None:
+        factory = _load(name)
+    return factory
+
+
+def _load(name):
+    with _load_lock:
+        if name in factories:
+            return factories[name]
+        module_name = registry.get(name)
+        if module_name is None:
+            raise KeyError(name)
+
+        before = set(factories)
+        start = time.time()
+        if module_name in sys.modules:
+            # Imported before, but its factories have since been reset.
+            reload(sys.modules[module_name])
+        else:
+            import_module(module_name)
+        import_times.append((module_name, time.time() - start, sorted(set(factories) - before)))
+        return factories[name]
+
+
+def register(module, *names):
+    """Registers the named factories as declared by the given module, which
+    is then only imported the first time one of them is used."""
+    for name in names:
+        registry[name] = module
+
+
+def discover(package):
+    """Registers every factory declared in the modules of the named package
+    (see `monufacture.discovery`) without importing any of them. Returns
+    the names of the factories found."""
+    global discovery_time
+    start = time.time()
+    found = discovery.scan(package)
+    for name, module in found.iteritems():
+        registry.setdefault(name, module)
+    discovery_time += time.time() - start
+    return sorted(found)
+
+
+def startup_report(stream=None):
+    """Writes how long each factory module took to import on demand,
+    slowest first, with the factories it declared."""
+    stream = stream or sys.stdout
+    row_format = "%-48s %10s  %s\n"
+    stream.write(row_format % ("module", "ms", "factories"))
+    for module, elapsed, names in sorted(import_times, key=lambda row: -row[1]):
+        stream.write(row_format % (module, "%.1f" % (elapsed * 1000), ", ".join(names)))
+    modules_registered = len(set(registry.itervalues()))
+    stream.write("%d of %d registered modules imported in %.1fms, discovery took %.1fms\n" % (
+        len(set(row[0] for row in import_times)), modules_registered,
+        sum(row[1] for row in import_times) * 1000, discovery_time * 1000))
+
+
+def declaring_modules():
+    """Returns the names of the modules which declared the registered
+    factories, in the order they were first seen."""
+    out = []
+    for name in modules.itervalues():
+        if name and name != "__main__" and name not in out:
+            out.append(name)
+    return out
 
 
 def _get_active_factory():
@@ -46,6 +148,8 @@ def trait(name, attrs, parent=None):
         _get_active_factory().trait(name, attrs, parent)
     else:
         traits[name] = Trait(attrs, parent)
+        for factory in factories.itervalues():
+            factory.invalidate_plans()
 
 
 def fragment(name, attrs=None, parent=None, traits=[]):
@@ -57,11 +161,18 @@ def embed(name, traits=[]):
 
 
 # Methods to create document instances using factories
-def create(factory_, document_=None, **overrides):
+def create(factory_, document_=None, read_back_=None, **overrides):
     """Creates and returns instance of the named document using the factory
     with which it was declared, utilising any provided attribute
-    overrides, storing the instance in the database."""
-    doc = factories[factory_].create(document_, **overrides)
+    overrides, storing the instance in the database.
+
+    Unless disabled by `read_back_`, the factory's `read_back` attribute or
+    the module-level `read_back` setting (in that order of precedence) the
+    stored document is read back from the database before returning."""
+    factory = get_factory(factory_)
+    if read_back_ is None and factory.read_back is None:
+        read_back_ = read_back
+    doc = factory.create(document_, read_back_, **overrides)
     if debug:
         logging.debug("CREATED [%s]: %s, document=%s, overrides=%s",
                       doc['_id'], factory_, document_, overrides)
@@ -72,34 +183,217 @@ def build(factory_, document_=None, **overrides):
     """Builds and returns instance of the named document using the factory
     with which it was declared, utilising any provided attribute
     overrides, without storing the instance in the database."""
-    return factories[factory_].build(document_, **overrides)
+    return get_factory(factory_).build(document_, **overrides)
+
 
+def build_raw(factory_, document_=None, **overrides):
+    """Builds an instance of the named document as a RawBSONDocument with an
+    `_id`, ready for insert_many. See `Factory.build_raw`."""
+    return get_factory(factory_).build_raw(document_, **overrides)
 
-def build_list(count_, factory_, document_=None, **overrides):
+
+def build_list(count_, factory_, document_=None, processes_=None, **overrides):
     """Builds a list of `count_` instances of the named document using the
-    associated factory."""
+    associated factory. If `processes_` is set the documents are built
+    across that many worker processes."""
+    if processes_:
+        return list(iter_build_parallel(count_, factory_, document_, processes_, **overrides))
     return [build(factory_, document_, **overrides) for x in range(count_)]
 
 
-def create_list(count_, factory_, document_=None, **overrides):
+def iter_build_parallel(count_, factory_, document_=None, processes_=None, **overrides):
+    """Builds `count_` instances of the named document across a pool of
+    worker processes (one per CPU by default), yielding them in order as
+    they are returned. See `monufacture.parallel` for the caveats."""
+    import parallel
+    return parallel.iter_build(count_, factory_, document_, processes_, overrides)
+
+
+def create_list(count_, factory_, document_=None, bulk_=False, workers_=None, read_back_=None,
+                **overrides):
     """Creates a list of `count_` instances of the named document using the
-    associated factory."""
-    return [create(factory_, document_, **overrides) for x in range(count_)]
+    associated factory. If `bulk_` is set the documents are written using
+    batched bulk inserts rather than one insert per document; bulk inserts
+    never read the documents back, so `read_back_` may not be set with it.
+    If `workers_` is set the documents are built in order then inserted
+    concurrently from that many threads."""
+    if bulk_:
+        if read_back_:
+            raise ValueError("Bulk created documents cannot be read back.")
+        return create_bulk(count_, factory_, document_, **overrides)
+    if workers_:
+        return create_concurrently(count_, workers_, factory_, document_, read_back_,
+                                   **overrides)
+    return [create(factory_, document_, read_back_, **overrides) for x in range(count_)]
+
+
+def create_concurrently(count_, workers_, factory_, document_=None, read_back_=None, **overrides):
+    """Creates `count_` instances of the named document, inserting them
+    from a pool of `workers_` threads. The documents are returned in the
+    order they were built."""
+    factory = get_factory(factory_)
+    if read_back_ is None and factory.read_back is None:
+        read_back_ = read_back
+    docs = factory.create_concurrently(count_, workers_, document_, read_back_, **overrides)
+    if debug:
+        for doc in docs:
+            logging.debug("CREATED [%s]: %s, document=%s, overrides=%s",
+                          doc['_id'], factory_, document_, overrides)
+    return docs
+
+
+def create_bulk(count_, factory_, document_=None, ordered_=True, raw_=False, **overrides):
+    """Creates `count_` instances of the named document using batched bulk
+    inserts. In unordered mode every batch is attempted even after a
+    failure; either way a BulkCreateException describing all failures is
+    raised after the successful inserts have been recorded for cleanup.
+    If `raw_` is set the documents are encoded to BSON as they are built
+    and returned as RawBSONDocuments."""
+    docs = get_factory(factory_).create_many(count_, document_, ordered_, raw_, **overrides)
+    if debug:
+        logging.debug("CREATED %d: %s, document=%s, overrides=%s",
+                      len(docs), factory_, document_, overrides)
+    return docs
+
+
+def iter_build(count_, factory_, document_=None, **overrides):
+    """Lazily builds `count_` instances of the named document, yielding
+    each as it is built."""
+    return get_factory(factory_).iter_build(count_, document_, **overrides)
+
+
+def iter_create(count_, factory_, document_=None, track_=True, **overrides):
+    """Lazily creates `count_` instances of the named document, overlapping
+    building with batched inserts so that memory use is bounded by the
+    factory's batch size. If `track_` is False the created documents are
+    not removed on cleanup."""
+    return get_factory(factory_).iter_create(count_, document_, track_, **overrides)
+
+
+def describe(factory_, document_=None):
+    """Prints the flattened declaration plan for the named document,
+    showing which parent, trait or document each attribute came from."""
+    print get_factory(factory_).describe(document_)
+
+
+def write_behind(size=1000):
+    """Enables write-behind creation for every factory, returning the shared
+    WriteBuffer: created documents are given a client-side `_id` and
+    returned immediately, and inserted in bulk once `size` documents are
+    buffered for a collection, on `flush()` and before cleanup. Passing
+    None flushes any buffered documents and disables write-behind."""
+    global write_buffer
+    if write_buffer is not None:
+        write_buffer.flush()
+
+    write_buffer = WriteBuffer(size) if size else None
+    for factory in factories.itervalues():
+        factory.write_buffer = write_buffer
+    return write_buffer
+
+
+def flush():
+    """Inserts all documents held in the write buffers of registered
+    factories, and in the one set by `write_behind`."""
+    buffers = [write_buffer] + [factory.write_buffer for factory in factories.values()]
+    flushed = []
+    for candidate in buffers:
+        if candidate is not None and not any(candidate is seen for seen in flushed):
+            candidate.flush()
+            flushed.append(candidate)
+
+
+def _swap_to_memory(factory):
+    original = factory.collection_name or factory.collection
+    _swapped[factory.name] = original
+    factory.collection = memory.replace(original, factory.name)
+
+
+def in_memory(enabled=True):
+    """Swaps the collection of every factory, including those declared
+    later, for a MemoryCollection, returning the MemoryDatabase holding
+    them. Factories sharing a collection share its replacement, and
+    factories declared without a collection are given one named after the
+    factory. Passing False restores the real collections. Documents
+    created so far are cleaned up before switching either way."""
+    global memory
+    cleanup()
+    if enabled:
+        memory = memory or MemoryDatabase()
+        for factory in factories.itervalues():
+            if factory.name not in _swapped:
+                _swap_to_memory(factory)
+        return memory
+
+    for factory in factories.itervalues():
+        if factory.name in _swapped:
+            factory.collection = _swapped.pop(factory.name)
+    memory = None
+
+
+def use_database(provider):
+    """Sets the database in which factories declared with the name of a
+    collection, e.g. `factory("user", "users")`, find it: a pymongo
+    Database or a function returning one. Documents created so far are
+    cleaned up first. Passing None unsets it."""
+    cleanup()
+    databases.use(provider)
+
+
+def use_worker_database(client, base_name="monufacture_test"):
+    """Points factories declared with collection names at a database of the
+    current test worker's own, named after `base_name` and the worker (see
+    `monufacture.databases.worker_id`), so parallel workers never see or
+    clean up each other's documents. All the databases share the client's
+    connection pool. Returns the database."""
+    database = client[databases.worker_database_name(base_name)]
+    use_database(database)
+    return database
 
 
 # Cleanup methods
-def cleanup():
+def cleanup(strategy=None):
     """Cleans up all factory data generated since the process was started,
-    or since the last time this method was called."""
-    for factory in factories.itervalues():
-        factory.cleanup()
+    or since the last time this method was called. Only factories which
+    have created documents are visited, and the ids of factories sharing a
+    collection are removed together using the given strategy, or the
+    module-level `cleanup_strategy` if none is provided. Any buffered
+    documents are inserted first so that they are cleaned up too."""
+    flush()
+
+    collections = []
+    ids_by_collection = {}
+    for factory in list(dirty):
+        key = id(factory.collection)
+        ids = factory.pop_created_ids()
+        if key not in ids_by_collection:
+            collections.append(factory.collection)
+            ids_by_collection[key] = ids
+        else:
+            ids_by_collection[key].extend(ids)
+            ids.close()
+
+    for pool in list(pools):
+        pool.clear()
+
+    try:
+        if collections:
+            strategy = strategy or cleanup_strategy
+            strategy([(collection, ids_by_collection[id(collection)])
+                      for collection in collections])
+    finally:
+        # Deletes the temporary files of trackers whose ids spilled to disk.
+        for ids in ids_by_collection.itervalues():
+            ids.close()
 
 def reset():
     """Resets Monufacturer, removing all registered factories. Only really
     here for testing purposes."""
     cleanup()
     factories.clear()
+    modules.clear()
     traits.clear()
+    _swapped.clear()
 
 
 class FactoryContextException(Exception):
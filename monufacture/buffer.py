@@ -0,0 +1,117 @@
+import bulk
+import strategies
+from threading import RLock
+
+"""Write-behind buffering for Factory.create. Documents created by a
+factory with a write buffer are given a client-side `_id` and returned
+immediately, then inserted in bulk when the buffer fills, when it is
+flushed explicitly, before cleanup, or before any other operation made
+through a collection wrapped by the buffer."""
+
+def _key(collection):
+    if isinstance(collection, BufferedCollection):
+        collection = collection._collection
+    return id(collection)
+
+
+class WriteBuffer(object):
+    """Holds created documents per collection until `size` have built up
+    for a collection, at which point they are inserted in bulk."""
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.pending = {}
+        self.lock = RLock()
+
+    def __len__(self):
+        return sum(len(entries) for collection, entries in self.pending.itervalues())
+
+    def add(self, factory, doc):
+        """Buffers a document created by the given factory."""
+        with self.lock:
+            key = _key(factory.collection)
+            if key not in self.pending:
+                self.pending[key] = (factory.collection, [])
+            entries = self.pending[key][1]
+            entries.append((factory, doc))
+            if len(entries) >= self.size:
+                self.flush(factory.collection)
+
+    def flush(self, collection=None):
+        """Inserts the buffered documents for the given collection, or for
+        every collection if none is given, recording their ids with their
+        factories. Every collection is attempted; if any insert fails a
+        BulkCreateException describing all failures is raised afterwards,
+        with error indexes counting through the documents of every
+        collection flushed. If an insert raises anything else, the documents
+        not known to be inserted stay buffered."""
+        from factory import BulkCreateException
+
+        with self.lock:
+            if collection is None:
+                groups = self.pending.items()
+                self.pending = {}
+            else:
+                key = _key(collection)
+                group = self.pending.pop(key, None)
+                groups = [(key, group)] if group else []
+
+            all_ids = []
+            all_errors = []
+            total = 0
+            for i, (key, (collection, entries)) in enumerate(groups):
+                docs = [doc for factory, doc in entries]
+                batches = []
+                track_owners = bulk.tracker_for(entries)
+
+                def track(ids):
+                    batches.append(ids)
+                    track_owners(ids)
+
+                try:
+                    strategies.prepare(collection)
+                    inserted_ids, errors = bulk.insert_documents(
+                        collection, docs, True, entries[0][0].batch_size,
+                        entries[0][0].max_batch_bytes, track)
+                except Exception:
+                    # Batches before the one which raised were inserted; that
+                    # one was tracked in case it was partly inserted, but is
+                    # kept too so none of its documents are lost.
+                    inserted = set(doc_id for ids in batches[:-1] for doc_id in ids)
+                    self.pending[key] = (collection, [(factory, doc) for factory, doc in entries
+                                                      if doc["_id"] not in inserted])
+                    self.pending.update(groups[i + 1:])
+                    raise
+
+                for error in errors:
+                    error["index"] += total
+                all_ids.extend(inserted_ids)
+                all_errors.extend(errors)
+                total += len(docs)
+
+            if all_errors:
+                raise BulkCreateException(all_errors, all_ids, total)
+
+    def wrap(self, collection):
+        """Returns a proxy for the collection which flushes this buffer's
+        documents for it before any operation other than an insert."""
+        return BufferedCollection(collection, self)
+
+
+class BufferedCollection(object):
+    """Proxies a pymongo collection, flushing the documents buffered for it
+    before calling any method other than the insert methods."""
+
+    def __init__(self, collection, write_buffer):
+        self._collection = collection
+        self._buffer = write_buffer
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith("insert"):
+            return attr
+
+        def flushing(*args, **kwargs):
+            self._buffer.flush(self._collection)
+            return attr(*args, **kwargs)
+        return flushing
@@ -0,0 +1,144 @@
+from lazy import lazy_import
+
+"""Functions for writing large numbers of documents to Mongo using as few
+round trips as possible while staying inside the server's limits."""
+
+bson = lazy_import("bson")
+raw_bson = lazy_import("bson.raw_bson")
+objectid = lazy_import("bson.objectid")
+pymongo_errors = lazy_import("pymongo.errors")
+
+# Maximum number of documents sent in a single insert_many call.
+MAX_BATCH_COUNT = 1000
+
+# Maximum encoded size of the raw documents sent in a single insert_many
+# call. Well below the server's 48MB message limit to leave room for
+# overhead. Other documents are only limited by count, since measuring
+# them means encoding them twice; pymongo splits each insert_many into
+# messages the server accepts regardless.
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+# Maximum number of ids listed in the $in clause of a single delete_many.
+MAX_DELETE_COUNT = 10000
+
+
+def encoded_size(doc):
+    """Returns the size of the given document once encoded as BSON."""
+    if isinstance(doc, raw_bson.RawBSONDocument):
+        return len(doc.raw)
+    return len(bson.BSON.encode(doc))
+
+
+def document_id(doc):
+    """Returns the `_id` of the given document. For a RawBSONDocument whose
+    first field is an ObjectId `_id`, as written by BSON.encode, the id is
+    read straight from the bytes rather than decoding the document."""
+    if isinstance(doc, raw_bson.RawBSONDocument):
+        raw = doc.raw
+        if raw[4:9] == "\x07_id\x00":
+            return objectid.ObjectId(raw[9:21])
+    return doc["_id"]
+
+
+def chunk_documents(docs, max_count=MAX_BATCH_COUNT, max_bytes=MAX_BATCH_BYTES):
+    """Splits the given documents into batches holding no more than
+    `max_count` documents and `max_bytes` of RawBSONDocuments, whose size
+    is known without encoding them. A document which is larger than
+    `max_bytes` on its own is sent in a batch by itself."""
+    batch = []
+    batch_bytes = 0
+    raw_document = raw_bson.RawBSONDocument
+    for doc in docs:
+        size = len(doc.raw) if isinstance(doc, raw_document) else 0
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(doc)
+        batch_bytes += size
+
+    if batch:
+        yield batch
+
+
+def insert_batch(collection, batch, ordered=True, offset=0):
+    """Inserts a single batch of documents, which must already have an
+    `_id`, with one insert_many. Returns a tuple of the ids inserted and a
+    list of write errors whose `index` is offset by `offset`."""
+    try:
+        collection.insert_many(batch, ordered=ordered)
+    except pymongo_errors.BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        failed = set(error["index"] for error in write_errors)
+        errors = []
+        for error in write_errors:
+            error = dict(error)
+            error["index"] += offset
+            errors.append(error)
+
+        if ordered and failed:
+            return [document_id(doc) for doc in batch[:min(failed)]], errors
+        return [document_id(doc) for i, doc in enumerate(batch) if i not in failed], errors
+
+    return [document_id(doc) for doc in batch], []
+
+
+def insert_documents(collection, docs, ordered=True,
+                     max_count=MAX_BATCH_COUNT, max_bytes=MAX_BATCH_BYTES, track=None):
+    """Inserts the given documents, which must already have an `_id`, in
+    batches. Returns a tuple of the ids inserted and a list of write errors
+    whose `index` refers to the position of the document in `docs`.
+
+    In ordered mode insertion stops at the first error, otherwise every
+    batch is attempted and all errors are collected.
+
+    If given, `track` is called with the ids of each batch as soon as it
+    has been inserted, so they can be cleaned up even if a later batch
+    raises something other than write errors. The batch which raised may
+    have been partly inserted, so all of its ids are passed to `track`
+    before the exception propagates; deleting the others is harmless."""
+    inserted_ids = []
+    errors = []
+    offset = 0
+    for batch in chunk_documents(docs, max_count, max_bytes):
+        try:
+            batch_ids, batch_errors = insert_batch(collection, batch, ordered, offset)
+        except Exception:
+            if track:
+                track([document_id(doc) for doc in batch])
+            raise
+        if track:
+            track(batch_ids)
+        inserted_ids.extend(batch_ids)
+        errors.extend(batch_errors)
+        if ordered and batch_errors:
+            break
+        offset += len(batch)
+
+    return inserted_ids, errors
+
+
+def tracker_for(entries):
+    """Returns a `track` function for insert_documents which records each
+    id with the factory of the matching (factory, document) entry."""
+    owners = dict((document_id(doc), factory) for factory, doc in entries)
+
+    def track(ids):
+        by_factory = {}
+        for doc_id in ids:
+            by_factory.setdefault(owners[doc_id], []).append(doc_id)
+        for factory, factory_ids in by_factory.iteritems():
+            factory.track_created(factory_ids)
+    return track
+
+
+def delete_documents(collection, ids, max_count=MAX_DELETE_COUNT):
+    """Deletes the documents with the given ids using one delete_many per
+    `max_count` ids. The ids may be a list or an IdTracker, which is read a
+    batch at a time."""
+    if hasattr(ids, "batches"):
+        batches = ids.batches(max_count)
+    else:
+        batches = (ids[i:i + max_count] for i in range(0, len(ids), max_count))
+    for batch in batches:
+        collection.delete_many({"_id": {"$in": batch}})
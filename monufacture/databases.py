@@ -0,0 +1,80 @@
+import os
+import re
+from threading import Lock
+
+"""Resolution of collections by name. Factories declared with the name of
+a collection, rather than a collection object, look it up in the database
+set with `monufacture.use_database`, so a test runner can point every
+factory at a database of its own without the declarations changing."""
+
+# Environment variables naming the current test worker, in order of
+# preference. PYTEST_XDIST_WORKER is set by pytest-xdist.
+WORKER_VARIABLES = ["MONUFACTURE_WORKER", "PYTEST_XDIST_WORKER"]
+
+_provider = None
+_database = None
+_collections = {}
+_lock = Lock()
+
+
+def use(provider):
+    """Sets where named collections are found: a pymongo Database, or a
+    function returning one which is called when a collection is first
+    needed. Passing None unsets it."""
+    global _provider, _database
+    with _lock:
+        _provider = provider
+        _database = None
+        _collections.clear()
+
+
+def database():
+    """Returns the current database, or None if none has been set."""
+    global _database
+    if _database is None and _provider is not None:
+        with _lock:
+            if _database is None:
+                # A pymongo Database is itself callable, so look for
+                # __getitem__ to tell one from a function returning one.
+                _database = _provider if hasattr(_provider, "__getitem__") else _provider()
+    return _database
+
+
+def resolve(name):
+    """Returns the named collection of the current database."""
+    collection = _collections.get(name)
+    if collection is None:
+        db = database()
+        if db is None:
+            raise IOError("Cannot resolve collection '%s' as no database has been set "
+                          "(see monufacture.use_database)." % name)
+        collection = _collections.setdefault(name, db[name])
+    return collection
+
+
+def worker_id():
+    """Returns the name of the current test worker, or "main" when not
+    running under a parallel test runner."""
+    for variable in WORKER_VARIABLES:
+        if os.environ.get(variable):
+            return os.environ[variable]
+    return "main"
+
+
+def worker_database_name(base_name):
+    """Returns the name of the database the current worker should use."""
+    return "%s_%s" % (base_name, worker_id())
+
+
+def drop_databases(client, base_name):
+    """Drops the worker databases created from `base_name` by pytest-xdist
+    workers or outside of a parallel runner, i.e. "<base_name>_gw<n>" and
+    "<base_name>_main", e.g. once all the workers have finished. Other
+    databases sharing the prefix, including those of workers named by
+    MONUFACTURE_WORKER, are left alone. Returns the names dropped."""
+    pattern = re.compile("^%s_(gw\\d+|main)$" % re.escape(base_name))
+    list_names = getattr(client, "list_database_names", None) or client.database_names
+    names = [name for name in list_names() if pattern.match(name)]
+    for name in names:
+        client.drop_database(name)
+    return names
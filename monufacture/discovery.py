@@ -0,0 +1,74 @@
+import ast
+import imp
+import os
+
+"""Finds the factories declared by the modules of a package by parsing
+their source rather than importing them, so that a test suite can learn
+where every factory lives without paying to import them all up front.
+Only factories declared with a literal name, as in
+`with factory("user", ...)`, are found."""
+
+
+def _context_exprs(node):
+    if not isinstance(node, ast.With):
+        return []
+    if hasattr(node, "items"):
+        return [item.context_expr for item in node.items]
+    return [node.context_expr]
+
+
+def _is_factory(func):
+    if isinstance(func, ast.Name):
+        return func.id == "factory"
+    return isinstance(func, ast.Attribute) and func.attr == "factory"
+
+
+def find_declarations(source, filename="<unknown>"):
+    """Returns the names of the factories declared in the given source."""
+    names = []
+    for node in ast.walk(ast.parse(source, filename)):
+        for expr in _context_exprs(node):
+            if (isinstance(expr, ast.Call) and _is_factory(expr.func) and expr.args
+                    and isinstance(expr.args[0], ast.Str)):
+                names.append(expr.args[0].s)
+    return names
+
+
+def _find(package):
+    """Returns the path of the named package or module, without importing
+    it."""
+    path = None
+    for part in package.split("."):
+        f, path, description = imp.find_module(part, [path] if path else None)
+        if f:
+            f.close()
+    return path
+
+
+def scan(package):
+    """Returns a dict mapping the name of every factory declared in the
+    named package (or module) to the module declaring it."""
+    found = {}
+
+    def parse(filename, module):
+        with open(filename) as f:
+            for name in find_declarations(f.read(), filename):
+                found.setdefault(name, module)
+
+    root = _find(package)
+    if not os.path.isdir(root):
+        parse(root, package)
+        return found
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "__init__.py" not in filenames:
+            dirnames[:] = []
+            continue
+        dirnames.sort()
+        relative = os.path.relpath(dirpath, root)
+        prefix = package if relative == "." else "%s.%s" % (package, relative.replace(os.sep, "."))
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                module = prefix if filename == "__init__.py" else "%s.%s" % (prefix, filename[:-3])
+                parse(os.path.join(dirpath, filename), module)
+    return found
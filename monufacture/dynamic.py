@@ -1,4 +1,5 @@
 from types import FunctionType
+import profiler
 
 
 def getitem(self, index, superclass):
@@ -9,22 +10,64 @@ def getitem(self, index, superclass):
 
     # If the value is a function, invoke it to get, set and return
     # the value.
-    if isinstance(value, FunctionType):
-        value = value(self)
+    if type(value) is FunctionType:
+        if profiler.active is None:
+            value = value(self)
+        else:
+            value = profiler.active.call(value, self, self.path + (index,))
 
     # If the value is an embedded dict, we need to wrap it in a
-    # DynamicDict instance.
+    # DynamicDict instance (unless it already is one sharing our head).
     if isinstance(value, dict):
-        value = DynamicDict(value, head=self.head)
+        if type(value) is not DynamicDict or value.head is not self.head:
+            value = DynamicDict(value, head=self.head, static=getattr(value, "static", frozenset()))
+        if profiler.active is not None:
+            value.path = self.path + (index,)
 
     # If the value is an embedded list, we need to wrap it in a
     # DynamicList instance.
+    elif isinstance(value, list):
+        if type(value) is not DynamicList or value.head is not self.head:
+            value = DynamicList(value, head=self.head)
+        if profiler.active is not None:
+            value.path = self.path + (index,)
+
+    superclass.__setitem__(index, value)
+    return value
+
+
+def is_static(value):
+    """Returns True if the given value contains no functions which would
+    need to be called when resolved."""
+    if type(value) is FunctionType:
+        return False
+    if isinstance(value, dict):
+        return all(is_static(v) for v in value.itervalues())
+    if isinstance(value, list):
+        return all(is_static(v) for v in value)
+    return True
+
+
+def copy_static(value):
+    """Copies the dicts and lists of a static value, as resolving it would,
+    without wrapping them in dynamic containers first."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.iteritems():
+            out[k] = copy_static(v) if isinstance(v, (dict, list)) else v
+        return out
     if isinstance(value, list):
-        value = DynamicList(value, head=self.head)
+        return [copy_static(v) if isinstance(v, (dict, list)) else v for v in value]
+    return value
 
-    self[index] = value
 
-    return superclass.__getitem__(index)
+def resolve_value(container, index, value):
+    """Resolves a single raw value held in a dynamic container."""
+    if type(value) is FunctionType or isinstance(value, (dict, list)):
+        value = container[index]
+        if type(value) is DynamicDict or type(value) is DynamicList:
+            return value.resolve()
+    return value
 
 
 class DynamicList(list):
@@ -32,6 +75,9 @@ class DynamicList(list):
     function, and if so return the result of calling that function.
     Note that each function is only called once."""
 
+    # Position of the list within the document, tracked while profiling.
+    path = ()
+
     def __init__(self, inner_list={}, head=None, *args, **kwargs):
         super(DynamicList, self).__init__(*args, **kwargs)
         self.head = self if not head else head
@@ -43,41 +89,44 @@ class DynamicList(list):
     def resolve(self):
         """"Resolves the dynamic list into a static list with
         static values."""
-        
-        out = []
-        for i in range(len(self)):
-            value = self[i]
-            if isinstance(value, DynamicDict) or isinstance(value, DynamicList):
-                out.append(value.resolve())
-            else:
-                out.append(value)
+        raw = list.__getitem__
+        return [resolve_value(self, i, raw(self, i)) for i in xrange(len(self))]
 
-        return out
 
 class DynamicDict(dict):
     """ A subclass of dict which checks whether a given key's value is a
     function, and if so return the result of calling that function.
-    Note that each function is only called once."""
+    Note that each function is only called once.
+
+    Keys listed in `static` are known to hold no functions (see
+    `is_static`), so their values are copied rather than walked when the
+    dictionary is resolved."""
 
-    def __init__(self, inner_dict={}, head=None, *args, **kwargs):
+    # Position of the dict within the document, tracked while profiling.
+    path = ()
+
+    def __init__(self, inner_dict={}, head=None, static=frozenset(), *args, **kwargs):
         super(DynamicDict, self).__init__(*args, **kwargs)
         self.head = self if not head else head
+        self.static = static
         self.update(inner_dict)
 
     def __getitem__(self, key):
         return getitem(self, key, super(DynamicDict, self))
 
-    def resolve(self):
+    def resolve(self, skip=frozenset()):
         """"Resolves the dynamic dictionary into a static dictionary with
-        static values."""
-        
+        static values, leaving out any keys in `skip`."""
         out = {}
-        for key in self:
-            value = self[key]
-
-            if isinstance(value, DynamicDict) or isinstance(value, DynamicList):
-                out[key] = value.resolve()
+        static = self.static
+        raw = dict.__getitem__
+        for key in self.keys():
+            if key in skip:
+                continue
+            value = raw(self, key)
+            if key in static and type(value) is not DynamicDict and type(value) is not DynamicList:
+                out[key] = copy_static(value)
             else:
-                out[key] = value
+                out[key] = resolve_value(self, key, value)
 
         return out
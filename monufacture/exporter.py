@@ -0,0 +1,106 @@
+import monufacture
+import graph
+import gzip
+import os
+from lazy import lazy_import
+
+"""Offline export of generated documents to files, e.g. as fixtures for
+other services or for mongoimport. Documents are built with creation
+deferred so no database is touched, and written out one at a time along
+with any dependencies created by id_of or dbref_to, so memory use stays
+constant however many documents are exported. Each collection gets a file
+of its own, named after the collection (or the factory, for factories
+declared without one)."""
+
+FORMATS = {"jsonl": ".json", "bson": ".bson"}
+
+bson = lazy_import("bson")
+json_util = lazy_import("bson.json_util")
+
+
+class Exporter(object):
+    """Writes documents to one file per collection in `directory`, either
+    as JSON Lines of Extended JSON ("jsonl") or as concatenated BSON
+    ("bson"), optionally gzipped. JSON is written in relaxed Extended JSON
+    unless other `json_options` are given. With pymongo older than 3.5,
+    which has no JSON options, pymongo's default Extended JSON is written
+    instead."""
+
+    def __init__(self, directory=".", format="jsonl", compress=False, json_options=None):
+        if format not in FORMATS:
+            raise ValueError("Unknown export format: %s" % format)
+        self.directory = directory
+        self.format = format
+        self.compress = compress
+        self.json_options = json_options or getattr(json_util, "RELAXED_JSON_OPTIONS", None)
+        self.files = {}
+        self.counts = {}
+        self.paths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _file(self, name):
+        stream = self.files.get(name)
+        if stream is None:
+            path = os.path.join(self.directory, name + FORMATS[self.format])
+            if self.compress:
+                path += ".gz"
+                stream = gzip.open(path, "wb")
+            else:
+                stream = open(path, "wb")
+            self.files[name] = stream
+            self.paths[name] = path
+            self.counts[name] = 0
+        return stream
+
+    def write(self, name, doc):
+        """Appends a document to the file for the named collection."""
+        stream = self._file(name)
+        if self.format == "bson":
+            stream.write(bson.BSON.encode(doc))
+        else:
+            if self.json_options is None:
+                stream.write(json_util.dumps(doc))
+            else:
+                stream.write(json_util.dumps(doc, json_options=self.json_options))
+            stream.write("\n")
+        self.counts[name] += 1
+
+    def export(self, count, factory_, document_=None, **overrides):
+        """Builds `count` instances of the named document and writes them,
+        along with their dependencies, to the files of their collections.
+        Each document is given an `_id` as if it had been created."""
+        factory = monufacture.get_factory(factory_)
+        with graph.deferred(persist=False) as deferred_graph:
+            for i in xrange(count):
+                deferred_graph.create(factory, document_, **overrides)
+                # Dependencies are added to the graph before the documents
+                # which refer to them, so are written out first.
+                for dependency, doc, depth in deferred_graph.pending:
+                    self.write(_collection_name(dependency), doc)
+                deferred_graph.clear()
+        return self.counts
+
+    def close(self):
+        for stream in self.files.itervalues():
+            stream.close()
+        self.files = {}
+
+
+def _collection_name(factory):
+    name = factory.collection_name or getattr(factory.collection, "name", None)
+    return name if isinstance(name, basestring) else factory.name
+
+
+def export(count_, factory_, document_=None, directory_=".", format_="jsonl", compress_=False,
+           **overrides):
+    """Exports `count_` instances of the named document, and their
+    dependencies, to files in `directory_`. Returns a dict of the path
+    written for each collection."""
+    with Exporter(directory_, format_, compress_) as exporter:
+        exporter.export(count_, factory_, document_, **overrides)
+    return exporter.paths
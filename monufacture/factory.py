@@ -1,4 +1,30 @@
-from dynamic import DynamicDict
+from dynamic import DynamicDict, is_static
+from lazy import lazy_import
+import bulk
+import strategies
+import rng
+import graph
+import profiler
+import databases
+from tracking import IdTracker
+from threading import Lock
+from collections import deque
+import struct
+
+bson = lazy_import("bson")
+objectid = lazy_import("bson.objectid")
+raw_bson = lazy_import("bson.raw_bson")
+multiprocessing_pool = lazy_import("multiprocessing.pool")
+
+# Set in the worker processes of a parallel build (see parallel.py), where
+# anything inserted would be neither returned to nor cleaned up by the
+# process which asked for the build.
+in_build_worker = False
+
+
+def _check_not_in_build_worker():
+    if in_build_worker:
+        raise WorkerCreateException()
 
 class Document(object):
     def __init__(self, attrs, parent=None, traits=[]):
@@ -20,59 +46,161 @@ class Fragment(object):
         self.traits = traits
 
 
+class Plan(object):
+    """A flattened view of a declaration and everything it inherits from
+    (parents and traits), computed once and reused for every build. The
+    embedded dicts and lists which contain no functions are noted so that
+    they can be copied without being walked at build time. For raw
+    builds every attribute other than `_id` which holds no functions is
+    encoded to BSON once and the bytes reused."""
+    def __init__(self, attrs, origins, declarations):
+        self.attrs = attrs
+        self.origins = origins
+        self.declarations = declarations
+        self.static = frozenset()
+        self.raw_static = frozenset()
+        self._static_bson = None
+
+    def compile(self):
+        self.static = frozenset(key for key, value in self.attrs.iteritems()
+                                if isinstance(value, (dict, list)) and is_static(value))
+        self.raw_static = frozenset(key for key, value in self.attrs.iteritems()
+                                    if key != "_id" and is_static(value))
+
+    def static_bson(self, keys):
+        """Returns the encoded BSON elements of the given static attributes,
+        caching them when they are all of the static attributes."""
+        if keys == self.raw_static and self._static_bson is not None:
+            return self._static_bson
+        elements = bson.BSON.encode(dict((key, self.attrs[key]) for key in keys))[4:-1]
+        if keys == self.raw_static:
+            self._static_bson = elements
+        return elements
+
+    def spec(self, overrides=None):
+        """Returns a fresh DynamicDict seeded with the planned attributes and
+        any overrides."""
+        if not overrides:
+            return DynamicDict(self.attrs, static=self.static)
+
+        spec = DynamicDict(self.attrs, static=self.static.difference(overrides))
+        spec.update(overrides)
+        return spec
+
+
 class Factory(object):
-    def __init__(self, collection=None, global_traits={}):
+    def __init__(self, collection=None, global_traits={}, dirty=None, name=None):
+        self.name = name
+        self.collection_name = None
         self.collection = collection
-        self.created_ids = []
+        self.dirty = dirty
+        self.id_spill_bytes = None
+        self.created_ids = IdTracker()
         self.documents = {}
         self.traits = {}
         self.fragments = {}
         self.global_traits = global_traits
+        self.read_back = None
+        self.write_buffer = None
+        self.build_count = 0
+        self.batch_size = bulk.MAX_BATCH_COUNT
+        self.max_batch_bytes = bulk.MAX_BATCH_BYTES
+        self.pipeline_depth = 2
+        self._plans = {}
+        self._lock = Lock()
+
+    @property
+    def collection(self):
+        """The factory's collection. Factories declared with the name of a
+        collection look it up in the current database (see
+        `monufacture.use_database`) every time."""
+        if self.collection_name is None:
+            return self._collection
+        return databases.resolve(self.collection_name)
+
+    @collection.setter
+    def collection(self, collection):
+        if isinstance(collection, basestring):
+            self.collection_name = collection
+            self._collection = None
+        else:
+            self.collection_name = None
+            self._collection = collection
 
+    def _merge(self, plan, attrs, origin):
+        plan.attrs.update(attrs)
+        plan.origins.update((key, origin) for key in attrs)
+        plan.declarations.append(origin)
 
-    def _apply_traits(self, doc, traits):
+    def _flatten_traits(self, plan, traits):
         for trait in traits:
-            doc.update(self._build_trait(trait))
+            self._flatten_trait(plan, trait)
 
-    def _build_fragment(self, name, inline_traits=[]):
+    def _flatten_fragment(self, plan, name, inline_traits=()):
         fragment = self.fragments[name]
         if fragment.parent:
-            spec = self._build_fragment(fragment.parent)
-        else:
-            spec = DynamicDict()
+            self._flatten_fragment(plan, fragment.parent)
 
-        if fragment.traits:
-            self._apply_traits(spec, fragment.traits)
+        self._flatten_traits(plan, fragment.traits)
+        self._flatten_traits(plan, inline_traits)
+        self._merge(plan, fragment.attrs, "fragment:%s" % name)
 
-        if inline_traits:
-            self._apply_traits(spec, inline_traits)
-
-        spec.update(fragment.attrs)
-        return spec
-
-    def _build_trait(self, name):
+    def _flatten_trait(self, plan, name, inline_traits=()):
         trait = self.traits.get(name) or self.global_traits.get(name)
         if trait.parent:
-            spec = self._build_trait(trait.parent)
-        else:
-            spec = DynamicDict()
+            self._flatten_trait(plan, trait.parent)
 
-        spec.update(trait.attrs)
-        return spec
+        self._merge(plan, trait.attrs, "trait:%s" % name)
 
-    def _build_document(self, name):
+    def _flatten_document(self, plan, name, inline_traits=()):
         doc = self.documents[name]
-
         if doc.parent:
-            spec = self._build_document(doc.parent)
-        else:
-            spec = DynamicDict()
+            self._flatten_document(plan, doc.parent)
+
+        self._flatten_traits(plan, doc.traits)
+        self._merge(plan, doc.attrs, "document:%s" % name)
+
+    def plan(self, kind, name, inline_traits=()):
+        """Returns the cached Plan for the named document, fragment or
+        trait, flattening its declarations on first use."""
+        key = (kind, name, tuple(inline_traits))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = Plan({}, {}, [])
+            getattr(self, "_flatten_%s" % kind)(plan, name, inline_traits)
+            plan.compile()
+            self._plans[key] = plan
+        return plan
+
+    def invalidate_plans(self):
+        """Discards all cached plans. Called whenever a declaration which
+        may feed into a plan changes."""
+        self._plans.clear()
 
-        if doc.traits:
-            self._apply_traits(spec, doc.traits)
+    def _build_fragment(self, name, inline_traits=[]):
+        return self.plan("fragment", name, inline_traits).spec()
 
-        spec.update(doc.attrs)
-        return spec
+    def _build_trait(self, name):
+        return self.plan("trait", name).spec()
+
+    def _build_document(self, name):
+        return self.plan("document", name).spec()
+
+    def describe(self, name_=None):
+        """Returns a printable description of the flattened plan for the
+        named document, showing where each attribute was declared."""
+        name_ = name_ or "default"
+        if name_ not in self.documents:
+            raise NonExistentDocumentException(name_)
+
+        plan = self.plan("document", name_)
+        lines = ["%s (%d attributes from %d declarations: %s)" % (
+            name_, len(plan.attrs), len(plan.declarations),
+            " > ".join(plan.declarations))]
+        for key in sorted(plan.attrs):
+            kind = "dynamic" if callable(plan.attrs[key]) else "static"
+            lines.append("  %-24s %-8s %s" % (key, kind, plan.origins[key]))
+        return "\n".join(lines)
 
     def build(self, name_=None, **overrides):
         """Builds an instance of the document described by the attributes
@@ -85,31 +213,249 @@ class Factory(object):
         if name_ not in self.documents:
             raise NonExistentDocumentException(name_)
 
-        spec = self._build_document(name_)
+        spec = self.plan("document", name_).spec(overrides)
+        with self._lock:
+            index = self.build_count
+            self.build_count += 1
+
+        if profiler.active is not None:
+            with profiler.active.document(self.name, name_):
+                return self._resolve(spec, index)
+        return self._resolve(spec, index)
+
+    def build_raw(self, name_=None, **overrides):
+        """Builds an instance of the document like `build`, but returns it
+        encoded as a RawBSONDocument, ready to be passed to insert_many
+        without being encoded again. The document is given an `_id`, which
+        is always its first field.
+
+        Attributes holding no functions (and not overridden) are encoded
+        once per declaration and their bytes copied into every document,
+        so only the dynamic attributes are resolved and encoded."""
+        if not name_:
+            name_ = "default"
 
-        spec.update(overrides)
-        return spec.resolve()
+        if name_ not in self.documents:
+            raise NonExistentDocumentException(name_)
+
+        plan = self.plan("document", name_)
+        spec = plan.spec(overrides)
+        static = plan.raw_static.difference(overrides) if overrides else plan.raw_static
+        with self._lock:
+            index = self.build_count
+            self.build_count += 1
 
-    def create(self, name_=None, **overrides):
+        if profiler.active is not None:
+            with profiler.active.document(self.name, name_):
+                doc = self._resolve(spec, index, static)
+        else:
+            doc = self._resolve(spec, index, static)
+
+        doc_id = doc.setdefault("_id", objectid.ObjectId())
+        # BSON.encode writes `_id` first, so the static elements go after it.
+        encoded = bson.BSON.encode(doc)
+        if not static:
+            return raw_bson.RawBSONDocument(encoded)
+        if type(doc_id) is objectid.ObjectId:
+            id_end = 21
+        else:
+            id_end = len(bson.BSON.encode({"_id": doc_id})) - 1
+        elements = plan.static_bson(static)
+        return raw_bson.RawBSONDocument("".join([
+            struct.pack("<i", len(encoded) + len(elements)), encoded[4:id_end],
+            elements, encoded[id_end:]]))
+
+    def _resolve(self, spec, index, skip=frozenset()):
+        if rng.get_seed() is None:
+            return spec.resolve(skip)
+        with rng.document_random(self.name, index):
+            return spec.resolve(skip)
+
+    def create(self, name_=None, read_back_=None, **overrides):
         """Builds an instance of the document using the same approach as
-        `build` but also persists the document to the database."""
+        `build` but also persists the document to the database.
+
+        By default the persisted document is read back from the database so
+        that any server-applied values are returned. If `read_back_` (or
+        failing that the factory's `read_back` attribute) is False, the
+        `_id` is assigned locally and the built document is returned
+        without the extra round trip.
+
+        Within a `deferred()` block the document is only built, given an
+        `_id` and added to the active DocumentGraph, so no collection is
+        needed until the graph is persisted. Otherwise if the
+        factory has a `write_buffer` the document is given an `_id` and
+        returned straight away, to be inserted when the buffer flushes."""
+        _check_not_in_build_worker()
+        deferred_graph = graph.active()
+        if deferred_graph is not None:
+            return deferred_graph.create(self, name_, **overrides)
+
         if not self.collection:
             raise IOError("Cannot create an instance when no collection is provided.")
 
+        if self.write_buffer is not None:
+            doc = self.build(name_, **overrides)
+            doc.setdefault("_id", objectid.ObjectId())
+            self.write_buffer.add(self, doc)
+            return doc
+
+        if read_back_ is None:
+            read_back_ = self.read_back is not False
+
         doc = self.build(name_, **overrides)
+        strategies.prepare(self.collection)
+        if profiler.active is not None:
+            with profiler.active.document(self.name, name_ or "default"):
+                return profiler.active.call(self._insert, doc, ("(insert)",), read_back_)
+        return self._insert(doc, read_back_)
+
+    def _insert(self, doc, read_back):
+        if not read_back:
+            doc.setdefault("_id", objectid.ObjectId())
+
         doc_id = self.collection.insert(doc)
-        self.created_ids.append(doc_id)
-        return self.collection.find_one(doc_id)
+        self.track_created([doc_id])
+        if read_back:
+            return self.collection.find_one(doc_id)
+        return doc
+
+    def create_concurrently(self, count_, workers_, name_=None, read_back_=None, **overrides):
+        """Builds `count_` instances of the document in order, so sequences
+        and other dynamic values are the same as a serial create, then
+        inserts them from a pool of `workers_` threads. Returns the created
+        documents in the order they were built."""
+        _check_not_in_build_worker()
+        if not self.collection:
+            raise IOError("Cannot create an instance when no collection is provided.")
+
+        if read_back_ is None:
+            read_back_ = self.read_back is not False
+
+        docs = [self.build(name_, **overrides) for x in range(count_)]
+        strategies.prepare(self.collection)
+
+        pool = multiprocessing_pool.ThreadPool(workers_)
+        try:
+            return pool.map(lambda doc: self._insert(doc, read_back_), docs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def create_many(self, count_, name_=None, ordered_=True, raw_=False, **overrides):
+        """Builds `count_` instances of the document and persists them using
+        as few bulk inserts as the factory's `batch_size` and
+        `max_batch_bytes` allow. Returns the built documents, each with its
+        `_id` set. If any inserts fail a BulkCreateException is raised
+        once all possible documents have been inserted; in ordered mode
+        no documents after the first failure are inserted.
+
+        If `raw_` is set the documents are built with `build_raw` and
+        returned as RawBSONDocuments."""
+        _check_not_in_build_worker()
+        if not self.collection:
+            raise IOError("Cannot create an instance when no collection is provided.")
 
+        if raw_:
+            docs = [self.build_raw(name_, **overrides) for x in xrange(count_)]
+        else:
+            docs = []
+            for x in range(count_):
+                doc = self.build(name_, **overrides)
+                doc.setdefault("_id", objectid.ObjectId())
+                docs.append(doc)
+
+        strategies.prepare(self.collection)
+        inserted_ids, errors = bulk.insert_documents(
+            self.collection, docs, ordered_, self.batch_size, self.max_batch_bytes,
+            self.track_created)
+
+        if errors:
+            raise BulkCreateException(errors, inserted_ids, len(docs))
+        return docs
+
+    def iter_build(self, count_, name_=None, **overrides):
+        """Lazily builds `count_` instances of the document."""
+        for x in xrange(count_):
+            yield self.build(name_, **overrides)
+
+    def iter_create(self, count_, name_=None, track_=True, **overrides):
+        """Lazily builds and persists `count_` instances of the document,
+        yielding each once it has been inserted. Documents are inserted in
+        batches (see `create_many`) by a background thread while the next
+        batches are built, with at most `pipeline_depth` batches in flight,
+        so memory use is bounded by the batch size rather than `count_`.
+
+        If `track_` is False the created ids are not recorded, and so are
+        not removed on cleanup."""
+        _check_not_in_build_worker()
+        if not self.collection:
+            raise IOError("Cannot create an instance when no collection is provided.")
+
+        def build_all():
+            for doc in self.iter_build(count_, name_, **overrides):
+                doc.setdefault("_id", objectid.ObjectId())
+                yield doc
+
+        def insert(batch):
+            inserted_ids, errors = bulk.insert_documents(
+                self.collection, batch, True, len(batch), self.max_batch_bytes,
+                self.track_created if track_ else None)
+            if errors:
+                raise BulkCreateException(errors, inserted_ids, len(batch))
+
+        strategies.prepare(self.collection)
+        pool = multiprocessing_pool.ThreadPool(1)
+        pending = deque()
+        try:
+            for batch in bulk.chunk_documents(build_all(), self.batch_size, self.max_batch_bytes):
+                pending.append((batch, pool.apply_async(insert, (batch,))))
+                while len(pending) > self.pipeline_depth:
+                    batch, result = pending.popleft()
+                    result.get()
+                    for doc in batch:
+                        yield doc
+
+            while pending:
+                batch, result = pending.popleft()
+                result.get()
+                for doc in batch:
+                    yield doc
+        finally:
+            pool.close()
+            pool.join()
+
+    def track_created(self, ids):
+        """Records the ids of documents created by this factory so that
+        they are removed on cleanup, marking the factory as dirty."""
+        with self._lock:
+            self.created_ids.spill_bytes = self.id_spill_bytes
+            self.created_ids.extend(ids)
+            if self.dirty is not None:
+                self.dirty.add(self)
+
+    def pop_created_ids(self):
+        """Returns the IdTracker holding the ids of all documents created
+        since the last cleanup and stops tracking them."""
+        with self._lock:
+            ids, self.created_ids = self.created_ids, IdTracker()
+            if self.dirty is not None:
+                self.dirty.discard(self)
+        return ids
 
     def cleanup(self):
-        """Cleanup all instances created by this factory."""
-        while len(self.created_ids) > 0:
-            self.collection.remove(self.created_ids.pop())
+        """Cleanup all instances created by this factory, first inserting
+        any of its collection's documents held in its write buffer."""
+        if self.write_buffer is not None:
+            self.write_buffer.flush(self.collection)
+        ids = self.pop_created_ids()
+        if ids:
+            bulk.delete_documents(self.collection, ids)
 
     def default(self, attrs, traits=[]):
         """Sets the default document dict for the factory."""
         self.documents["default"] = Document(attrs, traits=traits)
+        self.invalidate_plans()
 
     def document(self, name, attrs=None, parent=None, traits=[]):
         """Declares a named document type within the factory."""
@@ -117,11 +463,13 @@ class Factory(object):
             raise FactoryDeclarationException("Cannot register a factory document with the name 'default'")
 
         self.documents[name] = Document(attrs or {}, parent, traits)
+        self.invalidate_plans()
 
     def trait(self, name, attrs, parent=None):
         """Declares a reusable trait hash which can be referenced in
         documents."""
         self.traits[name] = Trait(attrs, parent)
+        self.invalidate_plans()
 
     def fragment(self, name, attrs=None, parent=None, traits=[]):
         """
@@ -129,6 +477,7 @@ class Factory(object):
         another fragment or trait) using the `embed` function.
         """
         self.fragments[name] = Fragment(attrs or {}, parent, traits)
+        self.invalidate_plans()
 
     def embed(self, name, traits=[]):
         """
@@ -139,7 +488,12 @@ class Factory(object):
         itself.
         """
         def build(*args):
-            return self._build_fragment(name, traits)
+            spec = self._build_fragment(name, traits)
+            # Adopt the head of the embedding document up front, which
+            # saves the spec from being copied when it is wrapped.
+            if args and hasattr(args[0], "head"):
+                spec.head = args[0].head
+            return spec
 
         return build
 
@@ -152,6 +506,28 @@ class NonExistentDocumentException(Exception):
     def __str__(self):
         return "Document declaration not found: \"%s\"" % self.name
 
+class BulkCreateException(Exception):
+    """Raised when some of the documents in a bulk create could not be
+    inserted. `errors` holds the server's write errors, with each `index`
+    referring to the position of the document in the list being created,
+    and `created_ids` the ids of the documents which were inserted."""
+    def __init__(self, errors, created_ids, total):
+        self.errors = errors
+        self.created_ids = created_ids
+        self.total = total
+
+    def __str__(self):
+        return "%d of %d documents could not be inserted, first error: %s" % (
+            self.total - len(self.created_ids), self.total,
+            self.errors[0].get("errmsg"))
+
+class WorkerCreateException(Exception):
+    """Raised when a document, typically a dependency created by id_of or
+    dbref_to, would be created while building in a parallel build worker."""
+    def __str__(self):
+        return ("Documents cannot be created while building in a worker process; "
+                "use a DependencyPool filled beforehand or build serially.")
+
 class FactoryDeclarationException(Exception):
     """Raised when an error has been detected in the declaration of a
     factory."""
@@ -0,0 +1,120 @@
+import bulk
+import strategies
+from contextlib import contextmanager
+from threading import local
+from lazy import lazy_import
+
+"""Deferred creation of documents. While a DocumentGraph is active, any
+document which would be created (including dependencies created by id_of
+and dbref_to) is instead given a client-side `_id` and collected in the
+graph, so builds are free of side effects. The whole graph can then be
+persisted with one bulk insert per collection."""
+
+objectid = lazy_import("bson.objectid")
+
+_local = local()
+
+
+def active():
+    """Returns the DocumentGraph active on this thread, if any."""
+    return getattr(_local, "graph", None)
+
+
+class DocumentGraph(object):
+    """The documents collected while deferring creation, along with how
+    deeply nested each was in the dependencies of the documents created
+    directly."""
+
+    def __init__(self):
+        self.pending = []
+        self.depth = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def create(self, factory, name_=None, **overrides):
+        """Builds a document with the factory and adds it to the graph in
+        place of inserting it."""
+        self.depth += 1
+        try:
+            doc = factory.build(name_, **overrides)
+        finally:
+            self.depth -= 1
+
+        doc.setdefault("_id", objectid.ObjectId())
+        self.pending.append((factory, doc, self.depth))
+        return doc
+
+    def documents(self):
+        """Returns the pending documents grouped by collection, in the order
+        they should be inserted: collections holding the most deeply nested
+        dependencies first. Each group is a tuple of the collection and a
+        list of (factory, document) pairs."""
+        groups = {}
+        order = []
+        for factory, doc, depth in self.pending:
+            key = id(factory.collection)
+            if key not in groups:
+                groups[key] = [factory.collection, [], depth]
+                order.append(key)
+            groups[key][1].append((factory, doc))
+            groups[key][2] = max(groups[key][2], depth)
+
+        order.sort(key=lambda key: -groups[key][2])
+        return [(groups[key][0], groups[key][1]) for key in order]
+
+    def clear(self):
+        self.pending = []
+
+    def persist(self, ordered=True):
+        """Inserts every pending document, one bulk insert per collection,
+        recording the created ids with their factories for cleanup. Raises
+        a BulkCreateException after recording the successful inserts if
+        any document could not be inserted."""
+        from factory import BulkCreateException
+
+        all_ids = []
+        all_errors = []
+        total = 0
+        for collection, entries in self.documents():
+            if not collection:
+                raise IOError("Cannot persist documents of factory '%s' as it has no collection."
+                              % entries[0][0].name)
+            docs = [doc for factory, doc in entries]
+            strategies.prepare(collection)
+            inserted_ids, errors = bulk.insert_documents(collection, docs, ordered,
+                                                         track=bulk.tracker_for(entries))
+            for error in errors:
+                error["collection"] = collection.name
+
+            all_ids.extend(inserted_ids)
+            all_errors.extend(errors)
+            total += len(docs)
+            if ordered and errors:
+                break
+
+        self.clear()
+        if all_errors:
+            raise BulkCreateException(all_errors, all_ids, total)
+
+
+@contextmanager
+def deferred(persist=True):
+    """Defers all document creation within the block to a DocumentGraph,
+    which is yielded. Unless `persist` is False the graph is persisted when
+    the block exits without an error; if the block is nested in another
+    deferred block, its documents are instead handed to the outer graph,
+    to be persisted along with it."""
+    previous = active()
+    graph = _local.graph = DocumentGraph()
+    try:
+        yield graph
+    finally:
+        _local.graph = previous
+
+    if persist:
+        if previous is not None:
+            previous.pending.extend(graph.pending)
+            graph.clear()
+        else:
+            graph.persist()
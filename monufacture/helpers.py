@@ -1,32 +1,97 @@
 import monufacture
+import rng
 import string
-import random
-from pytz import timezone
 from datetime import datetime, timedelta
-from bson.objectid import ObjectId
-from bson.dbref import DBRef
+from threading import Lock, RLock
+import weakref
+from binascii import unhexlify
+from lazy import lazy_import
 
 """Contains setter functions designed to be used inline with
 factory definitions to inject dynamic values into models as
 and when they are built."""
 
+pytz = lazy_import("pytz")
+objectid = lazy_import("bson.objectid")
+dbref = lazy_import("bson.dbref")
+
+# Weak references to every Sequence, in the order they were declared.
+_sequences = []
+
+
+def sequences():
+    """Returns all live Sequence instances in declaration order."""
+    live = [ref() for ref in _sequences]
+    return [sequence for sequence in live if sequence is not None]
+
 
 class Sequence(object):
-    def __init__(self):
+    def __init__(self, store=None):
         self.seq_num = 0
+        self.block_end = 0
+        self.store = store
+        self.lock = Lock()
+        _sequences.append(weakref.ref(self))
 
     def next(self):
-        self.seq_num = self.seq_num + 1
-        return self.seq_num
-
-
-def sequence(fn=None):
+        with self.lock:
+            if self.store and self.seq_num >= self.block_end:
+                block_start, self.block_end = self.store.reserve()
+                self.seq_num = block_start - 1
+            self.seq_num = self.seq_num + 1
+            return self.seq_num
+
+
+def find_sequences(value, found=None, depth=0):
+    """Returns the Sequences reachable from the given declared value through
+    dicts, lists, declarations and the defaults and closures of functions,
+    each once and in a stable order. Sequences only reachable through
+    module globals are not found."""
+    from factory import Document, Trait, Fragment
+    found = [] if found is None else found
+    if depth > 16:
+        return found
+    if isinstance(value, Sequence):
+        if not any(value is seen for seen in found):
+            found.append(value)
+    elif callable(value) and hasattr(value, "__code__"):
+        for default in value.__defaults__ or ():
+            find_sequences(default, found, depth + 1)
+        for cell in value.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                continue
+            find_sequences(contents, found, depth + 1)
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            find_sequences(value[key], found, depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            find_sequences(item, found, depth + 1)
+    elif isinstance(value, (Document, Trait, Fragment)):
+        find_sequences(value.attrs, found, depth + 1)
+    return found
+
+
+def factory_sequences(factory, found=None):
+    """Returns the Sequences used by the declarations of the given factory,
+    including the global traits, in a stable order."""
+    return find_sequences([factory.documents, factory.traits, factory.fragments,
+                           factory.global_traits], found)
+
+
+def sequence(fn=None, store=None):
     """Defines a sequential value for a factory attribute. On each successive
     invocation of this helper (i.e. when a new instance of a document is
     created by the enclosing factory) the given function is passed a
     sequentially incrementing number which should be used to return a dynamic
-    value to be used on the model instance."""
-    sequence = Sequence()
+    value to be used on the model instance.
+
+    If a store (see `monufacture.sequence_stores`) is given, numbers are
+    reserved from it in blocks so they are unique across processes sharing
+    the store, though not necessarily contiguous."""
+    sequence = Sequence(store)
 
     if not fn:
         fn = lambda n: n
@@ -46,9 +111,74 @@ def dependent(fn):
     return build
 
 
-def id_of(factory_, document_=None, **overrides):
+class DependencyPool(object):
+    """A pool of dependency documents which id_of and dbref_to can draw on
+    instead of creating a new document every time. Up to `size` documents
+    are created per distinct (factory, document, overrides) on first use,
+    then handed out in turn ("round_robin") or at random ("random").
+    Pooled documents are removed as usual on cleanup, which also empties
+    the pool."""
+
+    def __init__(self, size=10, order="round_robin"):
+        if order not in ("round_robin", "random"):
+            raise ValueError("Pool order must be 'round_robin' or 'random'.")
+        self.size = size
+        self.order = order
+        self.docs = {}
+        self.draws = {}
+        self.lock = RLock()
+        monufacture.pools.add(self)
+
+    def get(self, factory_, document_=None, **overrides):
+        """Returns a pooled instance of the named document."""
+        key = (factory_, document_, repr(sorted(overrides.items())))
+        with self.lock:
+            docs = self.docs.get(key)
+            if docs is None:
+                docs = [monufacture.create(factory_, document_, **overrides)
+                        for x in range(self.size)]
+                self.docs[key] = docs
+
+            if self.order == "random":
+                return rng.current().choice(docs)
+
+            draws = self.draws.get(key, 0)
+            self.draws[key] = draws + 1
+            return docs[draws % len(docs)]
+
+    def clear(self):
+        with self.lock:
+            self.docs.clear()
+            self.draws.clear()
+
+
+def _create_dependency(args, reuse, factory_, document_, overrides):
+    """Creates (or reuses) the dependency document for id_of and dbref_to.
+    `reuse` is None to always create, a DependencyPool to draw from, or
+    "document" to share a single instance between every identical helper in
+    the document being built."""
+    if reuse is None:
+        return monufacture.create(factory_, document_, **overrides)
+
+    if reuse == "document":
+        head = getattr(args[0], "head", None) if args else None
+        if head is None:
+            return monufacture.create(factory_, document_, **overrides)
+
+        shared = head.__dict__.setdefault("shared_dependencies", {})
+        key = (factory_, document_, repr(sorted(overrides.items())))
+        if key not in shared:
+            shared[key] = monufacture.create(factory_, document_, **overrides)
+        return shared[key]
+
+    return reuse.get(factory_, document_, **overrides)
+
+
+def id_of(factory_, document_=None, reuse_=None, **overrides):
     """Creates an instance using the given named factory and returns the
-    ID of the persisted record. """
+    ID of the persisted record. If `reuse_` is a DependencyPool the
+    instance is drawn from the pool instead, and if it is "document" one
+    instance is shared by every identical id_of in the document."""
     def build(*args):
         # Flatten an function overrides
         instance_overrides = {}
@@ -58,7 +188,7 @@ def id_of(factory_, document_=None, **overrides):
             else:
                 instance_overrides[key] = value
 
-        return monufacture.create(factory_, document_, **instance_overrides)["_id"]
+        return _create_dependency(args, reuse_, factory_, document_, instance_overrides)["_id"]
     return build
 
 
@@ -67,9 +197,56 @@ def text(*args, **kwargs):
     return random_text(*args, **kwargs)
 
 
+class RandomText(object):
+    """Generates random text for random_text. Where every character in the
+    char set is a single byte, text is generated by drawing random bytes in
+    bulk and mapping them through a translation table (discarding any which
+    would bias the distribution) rather than choosing one character at a
+    time."""
+
+    def __init__(self, length, char_set):
+        self.length = length
+        self.char_set = char_set
+        self.fast = (0 < len(char_set) <= 256 and
+                     all(isinstance(c, str) and len(c) == 1 for c in char_set))
+
+        if self.fast:
+            limit = 256 - 256 % len(char_set)
+            self.yield_ratio = limit / 256.0
+            self.table = "".join(char_set[i % len(char_set)] for i in range(256))
+            self.rejected = "".join(chr(i) for i in range(limit, 256))
+
+    def __call__(self, *args):
+        return self.batch(1)[0]
+
+    def _chars(self, count):
+        out = []
+        remaining = count
+        while remaining > 0:
+            request = int(remaining / self.yield_ratio) + 16
+            raw = unhexlify("%0*x" % (request * 2, rng.current().getrandbits(request * 8)))
+            chars = raw.translate(self.table, self.rejected)[:remaining]
+            out.append(chars)
+            remaining -= len(chars)
+        return "".join(out)
+
+    def batch(self, count):
+        """Returns a list of `count` random strings in one go."""
+        if self.length == 0:
+            return [""] * count
+        if not self.fast:
+            choice = rng.current().choice
+            return ["".join([choice(self.char_set) for i in xrange(self.length)])
+                    for n in xrange(count)]
+
+        chars = self._chars(count * self.length)
+        return [chars[i:i + self.length] for i in xrange(0, count * self.length, self.length)]
+
+
 def random_text(length=10, spaces=False, digits=False, upper=True,
                 lower=True, other_chars=[]):
-    """Inserts some random text of the given length into the document."""
+    """Inserts some random text of the given length into the document. The
+    returned builder also has a `batch(n)` method returning n strings."""
 
     # Build the char set we'll use
     char_set = []
@@ -83,19 +260,23 @@ def random_text(length=10, spaces=False, digits=False, upper=True,
         char_set += list(string.digits)
     char_set += other_chars
 
+    generator = RandomText(length, char_set)
+
     def build(*args):
-        return "".join([random.choice(char_set) for i in xrange(length)])
+        return generator()
+    build.batch = generator.batch
     return build
 
 
-def dbref_to(factory, document=None, **overrides):
+def dbref_to(factory, document=None, reuse_=None, **overrides):
     """Create a DBRef-type subdoc structure linking to a new instance of the
-    given named factory type."""
+    given named factory type. If `reuse_` is given the instance may be
+    shared, as with id_of."""
 
     def build(*args):
         collection = monufacture.get_factory(factory).collection.name
-        _id = monufacture.create(factory, document, **overrides)["_id"]
-        return DBRef(collection, _id)
+        _id = _create_dependency(args, reuse_, factory, document, overrides)["_id"]
+        return dbref.DBRef(collection, _id)
     return build
 
 def date(year=None, month=None, day=None, hour=None, minute=None, second=None, microsecond=None, tz=None):
@@ -123,7 +304,7 @@ def date(year=None, month=None, day=None, hour=None, minute=None, second=None, m
         def build_specific(*args):
             dt = datetime(**dt_args)
             if tz:
-                dt = timezone(tz).localize(dt)
+                dt = pytz.timezone(tz).localize(dt)
             return dt
 
         return build_specific
@@ -183,7 +364,7 @@ def object_id():
     """Returns a builder function which will insert a new ObjectId
     when the object is built."""
     def build(*args):
-        return ObjectId()
+        return objectid.ObjectId()
     return build
 
 
@@ -204,14 +385,14 @@ def one_of(*values):
     random. Useful for getting a range of different but valid
     field values on a list of document instances."""
     def build(*args):
-        return random.choice(values)
+        return rng.current().choice(values)
     return build
 
 
 def random_number(a, b=None):
     """Inserts a random number in the given range into the document."""
     def build(*args):
-        return random.randrange(a, b)
+        return rng.current().randrange(a, b)
     return build
 
 
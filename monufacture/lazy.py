@@ -0,0 +1,28 @@
+from importlib import import_module
+
+"""Deferred imports, so that importing monufacture (and the modules
+declaring factories) doesn't pay for pymongo, bson or pytz until they are
+actually used."""
+
+
+class LazyModule(object):
+    """Stands in for a module, importing it when one of its attributes is
+    first used. Attributes are copied onto the stand-in as they are looked
+    up, so later lookups cost no more than on the module itself."""
+
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        value = getattr(import_module(self._lazy_name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return "<lazy module %r>" % self._lazy_name
+
+
+def lazy_import(name):
+    """Returns a stand-in for the named module which imports it on first
+    use."""
+    return LazyModule(name)
@@ -0,0 +1,418 @@
+from collections import OrderedDict
+from copy import deepcopy
+from numbers import Number
+from threading import RLock
+from lazy import lazy_import
+
+"""An in-memory stand-in for a pymongo collection, for tests which only
+need documents to be created, looked up and cleaned up without a mongod.
+Supports the insert, find, delete and simple update methods with basic
+filtering: equality on (dotted) fields, the comparison operators $eq, $ne,
+$gt, $gte, $lt, $lte, $in, $nin and $exists, and $and, $or and $nor.
+Indexes can be created and listed but are not enforced, apart from the
+uniqueness of `_id`."""
+
+bson = lazy_import("bson")
+objectid = lazy_import("bson.objectid")
+raw_bson = lazy_import("bson.raw_bson")
+pymongo = lazy_import("pymongo")
+pymongo_errors = lazy_import("pymongo.errors")
+results = lazy_import("pymongo.results")
+
+
+def _key(doc_id):
+    """Returns a hashable key for an `_id` value."""
+    try:
+        hash(doc_id)
+        return doc_id
+    except TypeError:
+        return repr(doc_id)
+
+
+def _values(doc, path):
+    """Returns the values found at the given dotted path, descending into
+    lists of embedded documents the way Mongo does."""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value
+                                 if isinstance(item, dict) and part in item)
+        values = found
+    return values
+
+
+def _candidates(values):
+    """Arrays match a condition if either the array or any element does."""
+    out = []
+    for value in values:
+        out.append(value)
+        if isinstance(value, list):
+            out.extend(value)
+    return out
+
+
+def _comparable(a, b):
+    if isinstance(a, Number) and isinstance(b, Number):
+        return not isinstance(a, bool) and not isinstance(b, bool)
+    return type(a) is type(b) or (isinstance(a, basestring) and isinstance(b, basestring))
+
+
+def _equal(values, expected):
+    if expected is None and not values:
+        return True
+    return any(value == expected for value in _candidates(values))
+
+
+def _compare(values, test, arg):
+    return any(_comparable(value, arg) and test(value, arg) for value in _candidates(values))
+
+
+_OPERATORS = {
+    "$eq": _equal,
+    "$ne": lambda values, arg: not _equal(values, arg),
+    "$in": lambda values, arg: any(_equal(values, item) for item in arg),
+    "$nin": lambda values, arg: not any(_equal(values, item) for item in arg),
+    "$gt": lambda values, arg: _compare(values, lambda a, b: a > b, arg),
+    "$gte": lambda values, arg: _compare(values, lambda a, b: a >= b, arg),
+    "$lt": lambda values, arg: _compare(values, lambda a, b: a < b, arg),
+    "$lte": lambda values, arg: _compare(values, lambda a, b: a <= b, arg),
+    "$exists": lambda values, arg: bool(values) == bool(arg)
+}
+
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and value and all(key.startswith("$") for key in value)
+
+
+def matches(doc, spec):
+    """Returns True if the document matches the given filter."""
+    for key, condition in spec.iteritems():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif _is_operator_dict(condition):
+            values = _values(doc, key)
+            for operator, arg in condition.iteritems():
+                if operator not in _OPERATORS:
+                    raise pymongo_errors.OperationFailure("%s is not supported by MemoryCollection" % operator)
+                if not _OPERATORS[operator](values, arg):
+                    return False
+        elif not _equal(_values(doc, key), condition):
+            return False
+    return True
+
+
+def _apply_update(doc, update):
+    for operator, fields in update.iteritems():
+        if operator not in ("$set", "$unset", "$inc"):
+            raise pymongo_errors.OperationFailure("%s is not supported by MemoryCollection" % operator)
+        for path, value in fields.iteritems():
+            parts = path.split(".")
+            target = doc
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            if operator == "$set":
+                target[parts[-1]] = deepcopy(value)
+            elif operator == "$unset":
+                target.pop(parts[-1], None)
+            else:
+                target[parts[-1]] = target.get(parts[-1], 0) + value
+
+
+def _sort_key(path):
+    def key(doc):
+        values = _values(doc, path)
+        # Missing fields sort first, as null does in Mongo.
+        return (bool(values), values[0] if values else None)
+    return key
+
+
+class MemoryCursor(object):
+    """The part of the pymongo Cursor API commonly used in tests: iteration,
+    `count`, `sort`, `skip`, `limit`, `rewind` and indexing. The matching
+    documents are copied when the cursor is created."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+        self._position = 0
+
+    def _check_not_started(self):
+        if self._results is not None:
+            raise pymongo_errors.InvalidOperation("cannot set options after executing query")
+
+    def sort(self, key_or_list, direction=None):
+        self._check_not_started()
+        if isinstance(key_or_list, basestring):
+            key_or_list = [(key_or_list, direction or pymongo.ASCENDING)]
+        # Stable sorts applied from the last key to the first.
+        for path, order in reversed(list(key_or_list)):
+            self.docs.sort(key=_sort_key(path), reverse=order == pymongo.DESCENDING)
+        return self
+
+    def skip(self, skip):
+        self._check_not_started()
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._check_not_started()
+        self._limit = limit
+        return self
+
+    def _windowed(self):
+        docs = self.docs[self._skip:]
+        return docs[:abs(self._limit)] if self._limit else docs
+
+    def count(self, with_limit_and_skip=False):
+        return len(self._windowed() if with_limit_and_skip else self.docs)
+
+    def rewind(self):
+        self._results = None
+        self._position = 0
+        return self
+
+    def __getitem__(self, index):
+        return self._windowed()[index]
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._results is None:
+            self._results = self._windowed()
+        if self._position >= len(self._results):
+            raise StopIteration
+        self._position += 1
+        return self._results[self._position - 1]
+
+    __next__ = next
+
+
+class MemoryCollection(object):
+    """A collection held in memory, implementing the parts of the pymongo
+    collection API used by factories and typical tests. Documents are
+    copied on the way in and out, so changing a returned document does not
+    change the stored one, just as with a real collection."""
+
+    def __init__(self, name="collection", database="memory"):
+        self.name = name
+        self.full_name = "%s.%s" % (database, name)
+        self.indexes = {}
+        self.docs = OrderedDict()
+        self.lock = RLock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __nonzero__(self):
+        # Empty collections are still collections.
+        return True
+
+    def __repr__(self):
+        return "MemoryCollection(%r)" % self.full_name
+
+    def _matching(self, spec):
+        if spec is not None and not isinstance(spec, dict):
+            spec = {"_id": spec}
+        if spec and len(spec) == 1 and "_id" in spec:
+            condition = spec["_id"]
+            if not _is_operator_dict(condition):
+                doc = self.docs.get(_key(condition))
+                return [doc] if doc is not None else []
+            if condition.keys() == ["$in"]:
+                keys = OrderedDict((_key(doc_id), None) for doc_id in condition["$in"])
+                docs = (self.docs.get(key) for key in keys)
+                return [doc for doc in docs if doc is not None]
+        if not spec:
+            return list(self.docs.itervalues())
+        return [doc for doc in self.docs.itervalues() if matches(doc, spec)]
+
+    def _insert(self, doc):
+        if isinstance(doc, raw_bson.RawBSONDocument):
+            doc = bson.BSON(doc.raw).decode()
+        if "_id" not in doc:
+            doc["_id"] = objectid.ObjectId()
+        key = _key(doc["_id"])
+        if key in self.docs:
+            raise pymongo_errors.DuplicateKeyError(
+                "E11000 duplicate key error collection: %s index: _id_ dup key: { : %r }"
+                % (self.full_name, doc["_id"]), 11000)
+        self.docs[key] = deepcopy(doc)
+        return doc["_id"]
+
+    def insert(self, doc_or_docs, *args, **kwargs):
+        """Legacy insert of one document or a list of documents, returning
+        the `_id` or list of `_id`s."""
+        with self.lock:
+            if isinstance(doc_or_docs, dict):
+                return self._insert(doc_or_docs)
+            return [self._insert(doc) for doc in doc_or_docs]
+
+    def insert_one(self, document, *args, **kwargs):
+        with self.lock:
+            return results.InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents, ordered=True, *args, **kwargs):
+        """Inserts the documents, raising a BulkWriteError with the same
+        details as the server would if any has a duplicate `_id`."""
+        inserted_ids = []
+        errors = []
+        with self.lock:
+            for index, doc in enumerate(documents):
+                try:
+                    inserted_ids.append(self._insert(doc))
+                except pymongo_errors.DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": doc})
+                    if ordered:
+                        break
+
+        if errors:
+            raise pymongo_errors.BulkWriteError({"writeErrors": errors, "writeConcernErrors": [],
+                                  "nInserted": len(inserted_ids), "nUpserted": 0,
+                                  "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                                  "upserted": []})
+        return results.InsertManyResult(inserted_ids, True)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        with self.lock:
+            found = self._matching(filter)
+            return deepcopy(found[0]) if found else None
+
+    def find(self, filter=None, *args, **kwargs):
+        """Returns a MemoryCursor over copies of the matching documents, in
+        insertion order unless sorted."""
+        with self.lock:
+            return MemoryCursor([deepcopy(doc) for doc in self._matching(filter)])
+
+    def count(self, filter=None, *args, **kwargs):
+        with self.lock:
+            return len(self._matching(filter))
+
+    def count_documents(self, filter, *args, **kwargs):
+        return self.count(filter)
+
+    def _delete(self, spec, limit=None):
+        with self.lock:
+            docs = self._matching(spec)[:limit]
+            for doc in docs:
+                del self.docs[_key(doc["_id"])]
+            return len(docs)
+
+    def delete_one(self, filter, *args, **kwargs):
+        return results.DeleteResult({"n": self._delete(filter, 1), "ok": 1.0}, True)
+
+    def delete_many(self, filter, *args, **kwargs):
+        return results.DeleteResult({"n": self._delete(filter), "ok": 1.0}, True)
+
+    def remove(self, spec_or_id=None, multi=True, *args, **kwargs):
+        """Legacy remove, returning the server's response document."""
+        return {"n": self._delete(spec_or_id, None if multi else 1), "ok": 1.0}
+
+    def _update(self, spec, update, upsert, limit=None):
+        with self.lock:
+            docs = self._matching(spec)[:limit]
+            for doc in docs:
+                _apply_update(doc, update)
+            upserted_id = None
+            if not docs and upsert:
+                doc = dict((key, deepcopy(value)) for key, value in (spec or {}).iteritems()
+                           if not key.startswith("$") and not _is_operator_dict(value))
+                _apply_update(doc, update)
+                upserted_id = self._insert(doc)
+            return docs, upserted_id
+
+    def update_one(self, filter, update, upsert=False, *args, **kwargs):
+        docs, upserted_id = self._update(filter, update, upsert, 1)
+        return results.UpdateResult(self._update_result(docs, upserted_id), True)
+
+    def update_many(self, filter, update, upsert=False, *args, **kwargs):
+        docs, upserted_id = self._update(filter, update, upsert)
+        return results.UpdateResult(self._update_result(docs, upserted_id), True)
+
+    def _update_result(self, docs, upserted_id):
+        result = {"n": len(docs) or int(upserted_id is not None),
+                  "nModified": len(docs), "ok": 1.0, "updatedExisting": bool(docs)}
+        if upserted_id is not None:
+            result["upserted"] = upserted_id
+        return result
+
+    # return_document defaults to ReturnDocument.BEFORE, which is False.
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=False, *args, **kwargs):
+        with self.lock:
+            found = self._matching(filter)[:1]
+            before = deepcopy(found[0]) if found else None
+            docs, upserted_id = self._update(filter, update, upsert, 1)
+            if return_document != pymongo.ReturnDocument.AFTER:
+                return before
+            if upserted_id is not None:
+                return deepcopy(self.docs[_key(upserted_id)])
+            return deepcopy(docs[0]) if docs else None
+
+    def create_index(self, keys, name=None, **kwargs):
+        """Records the index so it is listed by index_information. Indexes
+        are not enforced."""
+        if isinstance(keys, basestring):
+            keys = [(keys, 1)]
+        name = name or "_".join("%s_%s" % (key, direction) for key, direction in keys)
+        spec = dict(kwargs)
+        spec["key"] = list(keys)
+        spec["v"] = 2
+        self.indexes[name] = spec
+        return name
+
+    def index_information(self):
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        info.update(deepcopy(self.indexes))
+        return info
+
+    def drop_indexes(self):
+        self.indexes = {}
+
+    def drop(self):
+        with self.lock:
+            self.docs.clear()
+            self.indexes = {}
+
+
+class MemoryDatabase(object):
+    """Hands out one MemoryCollection per collection name, so factories
+    which share a collection also share its in-memory replacement."""
+
+    def __init__(self, name="memory"):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self.name)
+        return self.collections[name]
+
+    def replace(self, collection, default_name):
+        """Returns the MemoryCollection standing in for the given collection
+        (or collection name), or for the given default name if the
+        collection is None."""
+        if isinstance(collection, MemoryCollection):
+            return collection
+        if isinstance(collection, basestring):
+            return self[collection]
+        name = getattr(collection, "name", None)
+        return self[name if isinstance(name, basestring) else default_name]
@@ -0,0 +1,120 @@
+import monufacture
+import factory
+import helpers
+from importlib import import_module
+from multiprocessing import Pool, Array, cpu_count
+from multiprocessing.sharedctypes import RawArray
+
+"""Spreads the building of large numbers of documents over a pool of
+worker processes.
+
+Factories are never pickled: each worker re-imports the modules which
+declared them (a no-op where workers are forked), so declarations using
+lambdas and closures are supported. Overrides, however, are sent to the
+workers and so must be picklable.
+
+Each worker is handed contiguous slices of the list. For every sequence
+not backed by a store, a slice first takes numbers from its own block,
+the numbers a serial build would use if the sequence were used once per
+document, so in that common case the documents match a serial build.
+Any further numbers are reserved in blocks from a counter shared by all
+the workers, starting after the numbers a serial build would use, so no
+number is handed out twice however often a sequence is used. Sequences
+backed by a store simply reserve their own blocks. Afterwards only the
+sequences which were used are moved on, past the highest number handed
+out. The build count of the factory being built is offset in the same
+way, so that with a seed set (see `monufacture.rng`) random values match
+a serial build.
+
+Documents can't be created in workers, since the process which asked for
+the build could neither return nor clean them up: factories using id_of
+or dbref_to must draw on a DependencyPool filled beforehand, or be built
+serially. Trying raises a WorkerCreateException."""
+
+# Upper bound on the number of documents built per task.
+MAX_CHUNK_SIZE = 1000
+
+# The sequences, shared counters and block size of this worker process.
+_worker = None
+
+
+class _SliceStore(object):
+    """Hands a sequence the numbers reserved for one slice of a parallel
+    build: its own block first, then blocks from the shared counter."""
+
+    def __init__(self, index, start, end, block_size):
+        self.index = index
+        self.home = (start, end) if end >= start else None
+        self.block_size = block_size
+
+    def reserve(self):
+        sequences, counters, high, block_size = _worker
+        with counters.get_lock():
+            if self.home:
+                block, self.home = self.home, None
+            else:
+                start = counters[self.index] + 1
+                counters[self.index] += self.block_size
+                block = (start, counters[self.index])
+            high[self.index] = max(high[self.index], block[1])
+        return block
+
+
+def _init_worker(modules, counters, high, block_size):
+    global _worker
+    for module in modules:
+        import_module(module)
+    factory.in_build_worker = True
+    _worker = (helpers.sequences(), counters, high, block_size)
+
+
+def _build_chunk(task):
+    factory_, document_, overrides, start, count, bases, build_count = task
+    sequences, counters, high, block_size = _worker
+    for index, (sequence, base) in enumerate(zip(sequences, bases)):
+        if base is not None:
+            sequence.store = _SliceStore(index, base + start + 1, base + start + count,
+                                         block_size)
+            sequence.block_end = 0
+    monufacture.get_factory(factory_).build_count = build_count + start
+    return [monufacture.build(factory_, document_, **overrides) for x in range(count)]
+
+
+def _chunk_size(count, processes):
+    return max(1, min(MAX_CHUNK_SIZE, count // (processes * 4)))
+
+
+def iter_build(count, factory_, document_=None, processes=None, overrides={}):
+    """Builds `count` instances of the named document across `processes`
+    worker processes (one per CPU by default), yielding them in the order a
+    serial build_list would have returned them."""
+    processes = processes or cpu_count()
+    build_factory = monufacture.get_factory(factory_)
+    sequences = helpers.sequences()
+    bases = [None if sequence.store else sequence.seq_num for sequence in sequences]
+    counters = Array("l", [(base or 0) + count for base in bases])
+    high = RawArray("l", [base or 0 for base in bases])
+    build_count = build_factory.build_count
+    chunk_size = _chunk_size(count, processes)
+    tasks = [(factory_, document_, overrides, start, min(chunk_size, count - start),
+              bases, build_count)
+             for start in range(0, count, chunk_size)]
+
+    pool = Pool(processes, _init_worker,
+                (monufacture.declaring_modules(), counters, high, chunk_size))
+    # Advanced as the work is dispatched, so that builds made while the
+    # documents are consumed, or after abandoning them, don't reuse counts.
+    build_factory.build_count = build_count + count
+    try:
+        for docs in pool.imap(_build_chunk, tasks):
+            for doc in docs:
+                yield doc
+    finally:
+        pool.terminate()
+        pool.join()
+        # Move on only the sequences the workers used, past every number
+        # they handed out.
+        for sequence, base, reached in zip(sequences, bases, high):
+            if base is not None and reached > base:
+                with sequence.lock:
+                    sequence.seq_num = max(sequence.seq_num, reached)
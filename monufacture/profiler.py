@@ -0,0 +1,93 @@
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock, local
+
+"""Opt-in profiling of document builds. While a Profiler is active, every
+function called to produce a field value is timed and recorded against
+the factory, document and path of the field. Timings are inclusive, so
+time spent creating dependencies (e.g. in id_of) is attributed to the
+field which triggered them as well as to the dependency's own fields."""
+
+# The active Profiler, if any. Checked on every function call made while
+# resolving a document, so kept as a plain module attribute.
+active = None
+
+_local = local()
+
+
+class Profiler(object):
+    """Accumulates call count, total and max time per (factory, document,
+    field path)."""
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = Lock()
+
+    @contextmanager
+    def document(self, factory, document):
+        """Attributes fields resolved within the block to the given factory
+        and document."""
+        stack = _local.__dict__.setdefault("stack", [])
+        stack.append((factory, document))
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def record(self, path, elapsed):
+        stack = getattr(_local, "stack", None)
+        factory, document = stack[-1] if stack else (None, None)
+        key = (factory, document, ".".join(str(part) for part in path))
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                self.stats[key] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+    def call(self, fn, node, path, *args):
+        """Calls a field's function on behalf of the dynamic containers,
+        recording how long it took."""
+        start = time.time()
+        try:
+            return fn(node, *args)
+        finally:
+            self.record(path, time.time() - start)
+
+    def results(self):
+        """Returns a list of dicts, one per field, slowest total first."""
+        with self.lock:
+            rows = [{"factory": factory, "document": document, "field": field,
+                     "calls": calls, "total": total, "max": longest,
+                     "mean": total / calls}
+                    for (factory, document, field), (calls, total, longest)
+                    in self.stats.iteritems()]
+        return sorted(rows, key=lambda row: -row["total"])
+
+    def dump(self, stream=None):
+        """Writes the results as a table, times in milliseconds."""
+        stream = stream or sys.stdout
+        row_format = "%-16s %-16s %-32s %8s %10s %10s %10s\n"
+        stream.write(row_format % ("factory", "document", "field", "calls",
+                                   "total ms", "mean ms", "max ms"))
+        for row in self.results():
+            stream.write(row_format % (
+                row["factory"], row["document"], row["field"], row["calls"],
+                "%.3f" % (row["total"] * 1000), "%.3f" % (row["mean"] * 1000),
+                "%.3f" % (row["max"] * 1000)))
+
+
+@contextmanager
+def profiling(profiler=None):
+    """Profiles every build and create within the block, yielding the
+    Profiler. Pass an existing Profiler to accumulate across blocks."""
+    global active
+    previous = active
+    active = profiler or Profiler()
+    try:
+        yield active
+    finally:
+        active = previous
@@ -0,0 +1,71 @@
+import monufacture
+import databases
+import pytest
+
+"""pytest plugin giving each test worker a database of its own, so suites
+run with pytest-xdist can create and clean up documents in parallel.
+
+Enabled by passing `--monufacture-uri` (or setting `monufacture_uri` in
+the ini file). Every worker then points factories declared with
+collection names, e.g. `factory("user", "users")`, at a database named
+after `--monufacture-database` and the worker ("monufacture_test_gw0"...),
+all sharing one client. When the run ends the controller drops all of the
+worker databases in one go; without xdist the single database is dropped
+instead."""
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("monufacture")
+    group.addoption("--monufacture-uri", dest="monufacture_uri", default=None,
+                    help="MongoDB URI for worker databases")
+    group.addoption("--monufacture-database", dest="monufacture_database", default=None,
+                    help="base name of the worker databases (default monufacture_test)")
+    parser.addini("monufacture_uri", "MongoDB URI for worker databases")
+    parser.addini("monufacture_database", "base name of the worker databases",
+                  default="monufacture_test")
+
+
+def _option(config, name):
+    return config.getoption(name) or config.getini(name)
+
+
+def _is_controller(config):
+    """True in the process coordinating pytest-xdist workers."""
+    return not hasattr(config, "workerinput") and getattr(config.option, "dist", "no") != "no"
+
+
+def pytest_configure(config):
+    uri = _option(config, "monufacture_uri")
+    if not uri:
+        return
+
+    from pymongo import MongoClient
+    client = MongoClient(uri, connect=False)
+    base_name = _option(config, "monufacture_database")
+    config._monufacture = (client, base_name)
+    if not _is_controller(config):
+        monufacture.use_worker_database(client, base_name)
+
+
+def pytest_unconfigure(config):
+    state = getattr(config, "_monufacture", None)
+    if state is None:
+        return
+
+    client, base_name = state
+    if _is_controller(config):
+        databases.drop_databases(client, base_name)
+    elif not hasattr(config, "workerinput"):
+        monufacture.use_database(None)
+        client.drop_database(databases.worker_database_name(base_name))
+    else:
+        monufacture.use_database(None)
+    client.close()
+
+
+@pytest.fixture
+def monufacture_db():
+    """The current worker's database. Documents created by factories
+    during the test are cleaned up afterwards."""
+    yield databases.database()
+    monufacture.cleanup()
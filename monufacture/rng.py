@@ -0,0 +1,54 @@
+import random
+from contextlib import contextmanager
+from hashlib import sha1
+from threading import local
+
+"""Seedable random number generation for helpers. Once a seed is set,
+each document built gets its own generator derived from the seed, the
+name of its factory and its position in that factory's builds, so any
+process or thread can build any slice of a dataset and get exactly the
+output of a serial run."""
+
+_seed = None
+_local = local()
+
+
+def seed(value):
+    """Sets the seed from which each document's generator is derived.
+    Passing None returns to using the global `random` module."""
+    global _seed
+    _seed = value
+
+
+def get_seed():
+    return _seed
+
+
+def derive(*parts):
+    """Derives a stable integer seed from the current seed and the given
+    parts, identical across processes and Python hash randomization."""
+    return int(sha1(repr((_seed,) + parts)).hexdigest()[:16], 16)
+
+
+def current():
+    """Returns the generator for the document currently being built, or the
+    `random` module itself if no seed has been set."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else random
+
+
+@contextmanager
+def document_random(factory_name, index):
+    """Makes a generator derived from the factory name and build index the
+    current generator for the duration of the block, if a seed is set."""
+    if _seed is None:
+        yield
+        return
+
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    _local.stack.append(random.Random(derive(factory_name, index)))
+    try:
+        yield
+    finally:
+        _local.stack.pop()
@@ -0,0 +1,52 @@
+from pymongo import ReturnDocument
+
+"""Shared storage for sequences used by several processes at once, e.g.
+parallel test workers writing to the same database. Numbers are reserved
+a block at a time so that shared storage is only consulted once per
+`block_size` values."""
+
+
+class MongoSequenceStore(object):
+    """Reserves blocks of sequence numbers by atomically incrementing a
+    counter document, named `name`, in the given collection."""
+
+    def __init__(self, collection, name, block_size=100):
+        self.collection = collection
+        self.name = name
+        self.block_size = block_size
+
+    def reserve(self):
+        """Returns the first and last numbers of a newly reserved block."""
+        counter = self.collection.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"value": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER)
+        end = counter["value"]
+        return end - self.block_size + 1, end
+
+
+class FileSequenceStore(object):
+    """Reserves blocks of sequence numbers from a counter held in a local
+    file, serialising access between processes with an exclusive lock."""
+
+    def __init__(self, path, block_size=100):
+        self.path = path
+        self.block_size = block_size
+
+    def reserve(self):
+        """Returns the first and last numbers of a newly reserved block."""
+        import fcntl
+
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                end = int(f.read().strip() or 0) + self.block_size
+                f.seek(0)
+                f.truncate()
+                f.write(str(end))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return end - self.block_size + 1, end
@@ -0,0 +1,286 @@
+import monufacture
+import bulk
+import graph
+import helpers
+import rng
+import strategies
+from factory import Document, Trait, Fragment, BulkCreateException
+from hashlib import sha1
+from numbers import Number
+from types import FunctionType, CodeType
+import errno
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from lazy import lazy_import
+
+"""Snapshots of generated datasets. A dataset is described by a list of
+(factory, [document,] count) entries and a seed. The first time it is
+requested it is generated without touching the database, written to one
+BSON file per factory alongside a manifest, then restored. Later requests
+for the same dataset, with the same factory declarations, stream the BSON
+files straight into insert_many without building any documents.
+
+Snapshots are keyed by a hash of every factory declaration, the seed and
+the counts. Functions are hashed by their code, constants and closures,
+so editing a lambda or a helper's arguments produces a new snapshot, but
+changes to module-level functions a lambda merely calls are not seen.
+
+The manifest also records where generating the dataset left each
+factory's build count and each sequence, and restoring moves them at
+least that far, so documents created afterwards carry on from the
+snapshot rather than repeating its values."""
+
+# Bumped whenever the layout of a snapshot changes.
+FORMAT = 2
+
+MANIFEST = "manifest.json"
+
+bson = lazy_import("bson")
+raw_bson = lazy_import("bson.raw_bson")
+
+
+def _fingerprint(value, out, depth=0):
+    if depth > 16:
+        return
+    if isinstance(value, FunctionType):
+        _fingerprint_code(value.__code__, out)
+        for default in value.__defaults__ or ():
+            _fingerprint(default, out, depth + 1)
+        for cell in value.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                contents = None
+            _fingerprint(contents, out, depth + 1)
+    elif isinstance(value, dict):
+        out.append("{")
+        for key in sorted(value, key=repr):
+            out.append(repr(key))
+            _fingerprint(value[key], out, depth + 1)
+        out.append("}")
+    elif isinstance(value, (list, tuple)):
+        out.append("[")
+        for item in value:
+            _fingerprint(item, out, depth + 1)
+        out.append("]")
+    elif isinstance(value, (Document, Trait, Fragment)):
+        out.append(type(value).__name__)
+        _fingerprint(value.__dict__, out, depth + 1)
+    elif value is None or isinstance(value, (basestring, Number)):
+        out.append(repr(value))
+    else:
+        # Other objects (sequences, pools, factories...) may hold locks or
+        # cycles, and rarely define the data, so only their type counts.
+        out.append("<%s>" % type(value).__name__)
+
+
+def _fingerprint_code(code, out):
+    out.append(code.co_code)
+    out.append(repr(code.co_names))
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            _fingerprint_code(const, out)
+        else:
+            out.append(repr(const))
+
+
+def _normalize(counts):
+    """Returns the counts as a list of (factory, document, count)."""
+    if isinstance(counts, dict):
+        counts = sorted(counts.iteritems())
+    out = []
+    for entry in counts:
+        if isinstance(entry[0], tuple):
+            (factory_, document_), count = entry
+        elif len(entry) == 2:
+            (factory_, count), document_ = entry, None
+        else:
+            factory_, document_, count = entry
+        out.append((factory_, document_, count))
+    return out
+
+
+def _load_all():
+    # Factories registered for lazy import count too, so load them first.
+    for name in list(monufacture.registry):
+        monufacture.get_factory(name)
+
+
+def _sequences():
+    """Returns the sequences of every factory in a stable order."""
+    found = []
+    for name in sorted(monufacture.factories):
+        helpers.factory_sequences(monufacture.factories[name], found)
+    return found
+
+
+def counters():
+    """Returns the build count of every factory and the number reached by
+    every sequence not backed by a store, in the order of `_sequences`."""
+    _load_all()
+    return {"build_counts": dict((name, factory.build_count)
+                                 for name, factory in monufacture.factories.iteritems()),
+            "sequences": [None if sequence.store else sequence.seq_num
+                          for sequence in _sequences()]}
+
+
+def advance(state):
+    """Moves build counts and sequences forward to at least the values in
+    the given `counters()`, never backwards."""
+    _load_all()
+    for name, build_count in state["build_counts"].iteritems():
+        factory = monufacture.factories.get(name)
+        if factory is not None:
+            factory.build_count = max(factory.build_count, build_count)
+    for sequence, seq_num in zip(_sequences(), state["sequences"]):
+        if seq_num is not None and not sequence.store:
+            with sequence.lock:
+                sequence.seq_num = max(sequence.seq_num, seq_num)
+
+
+def key(counts, seed=0):
+    """Returns the key identifying the snapshot of the given dataset with
+    the factories as currently declared."""
+    _load_all()
+
+    out = [repr((FORMAT, seed, _normalize(counts)))]
+    for name in sorted(monufacture.factories):
+        factory = monufacture.factories[name]
+        collection_name = factory.collection_name or getattr(factory.collection, "name", None)
+        out.append(repr((name, collection_name if isinstance(collection_name, basestring) else None)))
+        _fingerprint([factory.documents, factory.traits, factory.fragments], out)
+    _fingerprint(monufacture.traits, out)
+    return sha1("\0".join(out)).hexdigest()
+
+
+def save(path, counts, seed=0):
+    """Generates the dataset with dependencies deferred and the given seed,
+    then writes it to the directory `path`. Returns the manifest.
+
+    The snapshot is written to a temporary directory alongside `path` and
+    renamed into place once complete, so a partial snapshot is never
+    mistaken for a complete one. If another process saves the same
+    snapshot first, its manifest is returned and this one is discarded."""
+    counts = _normalize(counts)
+    parent = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    previous = rng.get_seed()
+    rng.seed(seed)
+    try:
+        with graph.deferred(persist=False) as deferred_graph:
+            for factory_, document_, count in counts:
+                factory = monufacture.get_factory(factory_)
+                for i in xrange(count):
+                    factory.create(document_)
+    finally:
+        rng.seed(previous)
+    state = counters()
+
+    temp = tempfile.mkdtemp(prefix=".%s." % os.path.basename(path), dir=parent)
+    try:
+        manifest = _write(temp, deferred_graph, counts, seed, state)
+        try:
+            os.rename(temp, path)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+    finally:
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+    return manifest
+
+
+def _write(path, deferred_graph, counts, seed, state):
+    files = []
+    handles = {}
+    try:
+        for collection, entries in deferred_graph.documents():
+            for factory, doc in entries:
+                if factory.name not in handles:
+                    entry = {"factory": factory.name, "file": "%s.bson" % factory.name, "count": 0}
+                    handle = open(os.path.join(path, entry["file"]), "wb")
+                    handles[factory.name] = (handle, entry)
+                    files.append(entry)
+                handle, entry = handles[factory.name]
+                handle.write(bson.BSON.encode(doc))
+                entry["count"] += 1
+    finally:
+        for handle, entry in handles.itervalues():
+            handle.close()
+
+    manifest = {"format": FORMAT, "seed": seed, "counts": counts, "files": files,
+                "counters": state}
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_documents(filename):
+    """Yields each document in a file of concatenated BSON as a
+    RawBSONDocument, reading the file through a memory map."""
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            end = len(data)
+            while offset < end:
+                length = struct.unpack_from("<i", data, offset)[0]
+                yield raw_bson.RawBSONDocument(data[offset:offset + length])
+                offset += length
+        finally:
+            data.close()
+
+
+def restore(path, ordered=True):
+    """Inserts the snapshot in the directory `path`, recording the ids
+    with the factories which generated them for cleanup, and advances build
+    counts and sequences past the values in the snapshot. Returns the
+    manifest. Raises a BulkCreateException after recording the successful
+    inserts if any document could not be inserted."""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    advance(manifest["counters"])
+
+    all_ids = []
+    all_errors = []
+    total = 0
+    for entry in manifest["files"]:
+        factory = monufacture.get_factory(entry["factory"])
+        strategies.prepare(factory.collection)
+        docs = read_documents(os.path.join(path, entry["file"]))
+        inserted_ids, errors = bulk.insert_documents(factory.collection, docs, ordered,
+                                                     factory.batch_size, factory.max_batch_bytes,
+                                                     factory.track_created)
+        all_ids.extend(inserted_ids)
+        all_errors.extend(errors)
+        total += entry["count"]
+        if ordered and errors:
+            break
+
+    if all_errors:
+        raise BulkCreateException(all_errors, all_ids, total)
+    return manifest
+
+
+def dataset(counts, seed=0, directory="snapshots"):
+    """Creates the described dataset, restoring it from its snapshot under
+    `directory` if there is one and generating and saving it first if not.
+    Returns the manifest, which lists the documents in each file."""
+    path = os.path.join(directory, key(counts, seed))
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        save(path, counts, seed)
+    return restore(path)
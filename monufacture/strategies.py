@@ -0,0 +1,104 @@
+import bulk
+import time
+
+"""Strategies for removing the documents created by factories during
+cleanup, along with timings so the fastest can be chosen for a suite."""
+
+# Indexes of dropped collections waiting to be re-created, keyed by the
+# collection's full name.
+_dropped = {}
+
+
+def prepare(collection):
+    """Called before a factory writes to a collection. If the collection
+    was dropped by a DropStrategy its indexes are re-created first."""
+    if _dropped:
+        pending = _dropped.pop(collection.full_name, None)
+        if pending:
+            _create_indexes(collection, pending)
+
+
+def _index_key(spec):
+    """Returns the key to create an index with. Text indexes are reported
+    with internal _fts and _ftsx fields in place of their text fields,
+    which are only listed in the index's weights."""
+    key = []
+    for field, direction in spec["key"]:
+        if field == "_fts":
+            key.extend((text_field, "text") for text_field in spec["weights"])
+        elif field != "_ftsx":
+            key.append((field, direction))
+    return key
+
+
+def _create_indexes(collection, index_specs):
+    for name, spec in index_specs.iteritems():
+        if name == "_id_":
+            continue
+        options = dict((k, v) for k, v in spec.iteritems() if k not in ("key", "v", "ns"))
+        collection.create_index(_index_key(spec), name=name, **options)
+
+
+class CleanupStrategy(object):
+    """Base class for cleanup strategies. Strategies are called with a list
+    of (collection, ids) pairs, one per collection touched since the last
+    cleanup, and record how long each cleanup took."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_time = None
+
+    def __call__(self, touched):
+        start = time.time()
+        for collection, ids in touched:
+            self.cleanup(collection, ids)
+        self.last_time = time.time() - start
+        self.total_time += self.last_time
+        self.calls += 1
+
+    def cleanup(self, collection, ids):
+        raise NotImplementedError()
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else None
+
+    def __str__(self):
+        return "%s: %d cleanups, %.4fs total, %s mean" % (
+            type(self).__name__, self.calls, self.total_time,
+            "%.4fs" % self.mean_time if self.calls else "n/a")
+
+
+class TrackedIdsStrategy(CleanupStrategy):
+    """Removes only the documents created by factories, by id. The default,
+    and the only safe choice when the collections hold other data."""
+
+    def cleanup(self, collection, ids):
+        bulk.delete_documents(collection, ids)
+
+
+class DeleteAllStrategy(CleanupStrategy):
+    """Removes every document from each collection written to by a factory.
+    Only suitable for databases owned entirely by the tests."""
+
+    def cleanup(self, collection, ids):
+        collection.delete_many({})
+
+
+class DropStrategy(CleanupStrategy):
+    """Drops each collection written to by a factory. The collection's
+    indexes are cached the first time it is dropped and re-created before
+    the next factory write to it. Only suitable for databases owned entirely
+    by the tests."""
+
+    def __init__(self):
+        super(DropStrategy, self).__init__()
+        self.index_specs = {}
+
+    def cleanup(self, collection, ids):
+        name = collection.full_name
+        if name not in self.index_specs:
+            self.index_specs[name] = collection.index_information()
+        collection.drop()
+        _dropped[name] = self.index_specs[name]
@@ -0,0 +1,123 @@
+import tempfile
+from lazy import lazy_import
+
+"""Compact tracking of the ids of created documents, so that long running
+processes don't need gigabytes to remember what to clean up. ObjectIds,
+by far the most common ids, are packed into a bytearray at 12 bytes each
+rather than kept as objects of over 100 bytes with their list slot. Any
+other ids are kept in a plain list."""
+
+objectid = lazy_import("bson.objectid")
+
+# ObjectIds read back at a time when iterating.
+READ_BATCH = 10000
+
+
+class IdTracker(object):
+    """Records ids in the order they are added, except that ids which are
+    not ObjectIds are returned after all of the ObjectIds. If `spill_bytes`
+    is set, packed ids are moved to an anonymous temporary file whenever
+    that many bytes have built up in memory."""
+
+    __hash__ = None
+
+    def __init__(self, spill_bytes=None, directory=None):
+        self.spill_bytes = spill_bytes
+        self.directory = directory
+        self.packed = bytearray()
+        self.others = []
+        self.file = None
+        self.spilled = 0
+
+    def __len__(self):
+        return (self.spilled + len(self.packed)) // 12 + len(self.others)
+
+    def __iter__(self):
+        for batch in self.batches(READ_BATCH):
+            for doc_id in batch:
+                yield doc_id
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return "IdTracker(%d ids)" % len(self)
+
+    def _pack(self, data):
+        self.packed.extend(data)
+        if self.spill_bytes and len(self.packed) >= self.spill_bytes:
+            self.spill()
+
+    def extend(self, ids):
+        """Records the given ids, which may be another IdTracker."""
+        if isinstance(ids, IdTracker):
+            for chunk in ids.chunks(READ_BATCH * 12):
+                self._pack(chunk)
+            self.others.extend(ids.others)
+            return
+
+        object_id = objectid.ObjectId
+        for doc_id in ids:
+            if type(doc_id) is object_id:
+                self._pack(doc_id.binary)
+            else:
+                self.others.append(doc_id)
+
+    def append(self, doc_id):
+        self.extend([doc_id])
+
+    def spill(self):
+        """Moves the packed ids held in memory to the temporary file."""
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.directory)
+        self.file.seek(0, 2)
+        self.file.write(self.packed)
+        self.spilled += len(self.packed)
+        del self.packed[:]
+
+    def chunks(self, size):
+        """Yields the packed ObjectIds as strings of at most `size` bytes
+        (rounded down to a whole number of ids), from disk then memory."""
+        size -= size % 12
+        data = ""
+        if self.file is not None:
+            self.file.seek(0)
+            remaining = self.spilled
+            while remaining:
+                data = self.file.read(min(size, remaining))
+                remaining -= len(data)
+                if len(data) == size:
+                    yield data
+                    data = ""
+        # Top up the last read from disk so batches stay full.
+        start = size - len(data)
+        data += str(self.packed[:start])
+        if data:
+            yield data
+        for start in xrange(start, len(self.packed), size):
+            yield str(self.packed[start:start + size])
+
+    def batches(self, size):
+        """Yields the ids as lists of at most `size` ids, building only one
+        batch of ObjectIds at a time."""
+        object_id = objectid.ObjectId
+        for chunk in self.chunks(size * 12):
+            yield [object_id(chunk[i:i + 12]) for i in xrange(0, len(chunk), 12)]
+        for start in xrange(0, len(self.others), size):
+            yield self.others[start:start + size]
+
+    def close(self):
+        """Forgets every id, deleting the temporary file if there is one."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.spilled = 0
+        self.packed = bytearray()
+        self.others = []
@@ -1,4 +1,22 @@
-from monufacture import cleanup
+from monufacture import cleanup, use_worker_database
+import atexit
 
-def enable_factories(testcase):
-    testcase.addCleanup(cleanup)
+# The worker databases enabled in this process, by (client, base name).
+_worker_databases = {}
+
+
+def enable_factories(testcase, strategy=None):
+    testcase.addCleanup(cleanup, strategy)
+
+
+def enable_worker_database(client, base_name="monufacture_test"):
+    """Points factories declared with collection names at a database of
+    this test worker's own (see `monufacture.use_worker_database`), which
+    is dropped when the process exits. Safe to call from every test
+    case's setUp or setUpClass; only the first call has any effect."""
+    key = (id(client), base_name)
+    if key not in _worker_databases:
+        database = use_worker_database(client, base_name)
+        _worker_databases[key] = database
+        atexit.register(client.drop_database, database.name)
+    return _worker_databases[key]
@@ -10,6 +10,7 @@ setuptools.setup(
     keywords="mongo mongodb database testing factory pymongo",
     url="http://github.com/gamechanger/monufacture",
     packages=["monufacture"],
+    entry_points={"pytest11": ["monufacture = monufacture.pytest_plugin"]},
     long_description="Monufacture is a factory framework with an API designed to make " +
                      "it as easy as possible to generate valid test data in MongoDB. " +
                      "Inspired by the excellent factory_girl Ruby Gem.",
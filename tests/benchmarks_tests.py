@@ -0,0 +1,43 @@
+from unittest import TestCase
+from monufacture import reset
+from benchmarks import run
+
+
+class TestBenchmarks(TestCase):
+
+    def tearDown(self):
+        reset()
+
+    def test_measure(self):
+        result = run.measure(run._create, "chain", 10)
+        self.assertTrue(result["docs_per_sec"] > 0)
+        self.assertTrue(result["relative"] > 0)
+        self.assertTrue(result["objects_per_doc"] > 0)
+        self.assertIn("peak_kb", result)
+
+    def test_measure_restores_global_state(self):
+        import monufacture
+        run.measure(run._create, "flat", 2)
+        self.assertTrue(monufacture.read_back)
+        self.assertEqual({}, monufacture.factories)
+        self.assertEqual(set(), monufacture.dirty)
+
+    def test_every_benchmark_runs(self):
+        for name, benchmark, factory_name, count in run.BENCHMARKS:
+            run.measure(benchmark, factory_name, 2)
+            reset()
+
+    def test_compare(self):
+        baseline = {
+            "a": {"relative": 100.0, "objects_per_doc": 2.0, "peak_kb": 1000},
+            "b": {"relative": 100.0, "objects_per_doc": 2.0, "peak_kb": 1000}
+        }
+        results = {
+            "a": {"docs_per_sec": 1.0, "relative": 90.0, "objects_per_doc": 2.0, "peak_kb": 1050},
+            "b": {"docs_per_sec": 1.0, "relative": 70.0, "objects_per_doc": 3.0, "peak_kb": 2000},
+            "c": {"docs_per_sec": 1.0, "relative": 1.0, "objects_per_doc": 9.0, "peak_kb": 9000}
+        }
+        regressions = run.compare(results, baseline, 0.25)
+        self.assertEqual([("b", "relative", 100.0, 70.0),
+                          ("b", "objects/doc", 2.0, 3.0),
+                          ("b", "peak kb", 1000, 2000)], regressions)
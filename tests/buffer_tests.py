@@ -0,0 +1,162 @@
+from unittest import TestCase
+from monufacture import factory, default, create, cleanup, reset, get_factory, write_behind, flush
+from monufacture.buffer import WriteBuffer
+from monufacture.factory import Factory
+from mock import Mock
+from bson.objectid import ObjectId
+
+
+class TestWriteBuffer(TestCase):
+
+    def setUp(self):
+        self.collection = Mock()
+        self.write_buffer = None
+
+    def tearDown(self):
+        if self.write_buffer is not None:
+            self.write_buffer.pending.clear()
+
+    def test_buffered_create(self):
+        factory = Factory(self.collection)
+        factory.default({"name": "John"})
+        factory.write_buffer = WriteBuffer(size=3)
+
+        docs = [factory.create() for x in range(4)]
+
+        self.assertIsInstance(docs[0]["_id"], ObjectId)
+        self.assertFalse(self.collection.insert.called)
+        self.collection.insert_many.assert_called_once_with(docs[:3], ordered=True)
+        self.assertEqual([doc["_id"] for doc in docs[:3]], factory.created_ids)
+
+        factory.write_buffer.flush()
+        self.collection.insert_many.assert_called_with(docs[3:], ordered=True)
+        self.assertEqual(4, len(factory.created_ids))
+        self.assertEqual(0, len(factory.write_buffer))
+
+    def test_wrapped_collection_flushes_before_reads(self):
+        write_buffer = WriteBuffer()
+        wrapped = write_buffer.wrap(self.collection)
+        factory = Factory(wrapped)
+        factory.default({})
+        factory.write_buffer = write_buffer
+
+        doc = factory.create()
+        self.assertEqual(1, len(write_buffer))
+        wrapped.insert_one({"other": True})
+        self.assertEqual(1, len(write_buffer))
+
+        wrapped.find_one(doc["_id"])
+        self.assertEqual(0, len(write_buffer))
+        self.collection.insert_many.assert_called_once_with([doc], ordered=True)
+        self.collection.find_one.assert_called_once_with(doc["_id"])
+
+    def test_flush_inserts_every_collection_despite_errors(self):
+        from monufacture.factory import BulkCreateException
+        from pymongo.errors import BulkWriteError
+        other = Mock()
+        self.collection.insert_many.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 0, "errmsg": "dup"}]})
+        write_buffer = WriteBuffer()
+        factories = [Factory(self.collection), Factory(other)]
+        for factory in factories:
+            factory.default({})
+            factory.write_buffer = write_buffer
+            factory.create()
+            factory.create()
+
+        with self.assertRaises(BulkCreateException) as context:
+            write_buffer.flush()
+        self.assertEqual(1, len(self.collection.insert_many.mock_calls))
+        self.assertEqual(1, len(other.insert_many.mock_calls))
+        self.assertEqual(0, len(write_buffer))
+        self.assertEqual(2, len(context.exception.created_ids))
+        self.assertEqual(4, context.exception.total)
+        self.assertEqual(1, len(context.exception.errors))
+
+    def test_flush_keeps_documents_not_inserted_on_failure(self):
+        other = Mock()
+        self.write_buffer = WriteBuffer()
+        factories = [Factory(self.collection), Factory(other)]
+        for factory in factories:
+            factory.default({})
+            factory.write_buffer = self.write_buffer
+            factory.create()
+        self.collection.insert_many.side_effect = IOError()
+        other.insert_many.side_effect = IOError()
+
+        self.assertRaises(IOError, self.write_buffer.flush)
+        self.assertEqual(2, len(self.write_buffer))
+
+    def test_flush_tracks_batches_inserted_before_a_failure(self):
+        from pymongo.errors import AutoReconnect
+        self.collection.insert_many.side_effect = [None, AutoReconnect()]
+        self.write_buffer = WriteBuffer()
+        factory = Factory(self.collection)
+        factory.default({})
+        factory.write_buffer = self.write_buffer
+        factory.batch_size = 2
+        docs = [factory.create() for x in range(3)]
+
+        self.assertRaises(AutoReconnect, self.write_buffer.flush)
+        # The failed batch is tracked in case it was partly inserted, and
+        # kept buffered so it is not lost.
+        self.assertEqual([doc["_id"] for doc in docs], factory.created_ids)
+        self.assertEqual([docs[2]], [doc for f, doc in self.write_buffer.pending.values()[0][1]])
+
+    def test_factory_cleanup_flushes_first(self):
+        factory = Factory(self.collection)
+        factory.default({})
+        factory.write_buffer = WriteBuffer()
+        doc = factory.create()
+
+        factory.cleanup()
+
+        self.collection.insert_many.assert_called_once_with([doc], ordered=True)
+        self.collection.delete_many.assert_called_once_with({"_id": {"$in": [doc["_id"]]}})
+
+
+class TestWriteBehind(TestCase):
+
+    def setUp(self):
+        self.collection = Mock()
+        with factory("user", self.collection):
+            default({"name": "John"})
+
+    def tearDown(self):
+        write_behind(None)
+        reset()
+
+    def test_write_behind_applies_to_all_factories(self):
+        write_buffer = write_behind(10)
+        with factory("company", self.collection):
+            default({})
+        self.assertIs(write_buffer, get_factory("user").write_buffer)
+        self.assertIs(write_buffer, get_factory("company").write_buffer)
+
+        create("user")
+        create("company")
+        self.assertEqual(2, len(write_buffer))
+        flush()
+        self.assertEqual(1, len(self.collection.insert_many.mock_calls))
+
+    def test_cleanup_flushes_first(self):
+        write_behind(10)
+        user = create("user")
+        cleanup()
+        self.collection.insert_many.assert_called_once_with([user], ordered=True)
+        self.collection.delete_many.assert_called_once_with({"_id": {"$in": [user["_id"]]}})
+
+    def test_flush_ignores_buffers_no_factory_uses(self):
+        orphan = WriteBuffer()
+        unregistered = Factory(Mock())
+        unregistered.collection.insert_many.side_effect = IOError()
+        orphan.add(unregistered, {"_id": ObjectId()})
+        cleanup()
+        self.assertEqual(1, len(orphan))
+
+    def test_disabling_flushes(self):
+        write_behind(10)
+        create("user")
+        write_behind(None)
+        self.assertTrue(self.collection.insert_many.called)
+        self.assertIsNone(get_factory("user").write_buffer)
@@ -0,0 +1,82 @@
+import unittest
+from monufacture.bulk import chunk_documents, insert_documents, encoded_size, document_id
+from mock import Mock
+from bson import BSON
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+
+
+class TestBulk(unittest.TestCase):
+
+    def test_chunk_by_count(self):
+        docs = [{"n": n} for n in range(5)]
+        batches = list(chunk_documents(docs, max_count=2))
+        self.assertEqual([[docs[0], docs[1]], [docs[2], docs[3]], [docs[4]]], batches)
+
+    def test_chunk_by_size(self):
+        docs = [RawBSONDocument(BSON.encode({"text": "x" * 100})) for n in range(4)]
+        size = encoded_size(docs[0])
+        batches = list(chunk_documents(docs, max_bytes=size * 3 - 1))
+        self.assertEqual([2, 2], [len(batch) for batch in batches])
+
+    def test_oversized_document_sent_alone(self):
+        docs = [RawBSONDocument(BSON.encode(doc))
+                for doc in [{"n": 1}, {"text": "x" * 100}, {"n": 2}]]
+        batches = list(chunk_documents(docs, max_bytes=50))
+        self.assertEqual([[docs[0]], [docs[1]], [docs[2]]], batches)
+
+    def test_dicts_only_chunked_by_count(self):
+        docs = [{"text": "x" * 100} for n in range(4)]
+        batches = list(chunk_documents(docs, max_count=3, max_bytes=50))
+        self.assertEqual([3, 1], [len(batch) for batch in batches])
+
+    def test_insert_documents_ordered_stops_at_first_error(self):
+        docs = [{"_id": ObjectId()} for n in range(6)]
+        collection = Mock()
+        collection.insert_many = Mock(side_effect=[
+            None,
+            BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "dup"}]}),
+            None])
+
+        inserted, errors = insert_documents(collection, docs, max_count=2)
+
+        self.assertEqual([doc["_id"] for doc in docs[:3]], inserted)
+        self.assertEqual([{"index": 3, "errmsg": "dup"}], errors)
+        self.assertEqual(2, len(collection.insert_many.mock_calls))
+
+    def test_insert_documents_unordered_collects_errors(self):
+        docs = [{"_id": ObjectId()} for n in range(6)]
+        collection = Mock()
+        collection.insert_many = Mock(side_effect=[
+            BulkWriteError({"writeErrors": [{"index": 0, "errmsg": "dup"}]}),
+            None,
+            BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "dup"}]})])
+
+        inserted, errors = insert_documents(collection, docs, ordered=False, max_count=2)
+
+        self.assertEqual([doc["_id"] for doc in docs[1:5]], inserted)
+        self.assertEqual([0, 5], [error["index"] for error in errors])
+
+    def test_insert_documents_tracks_each_batch(self):
+        from pymongo.errors import AutoReconnect
+        docs = [{"_id": ObjectId()} for n in range(5)]
+        collection = Mock()
+        collection.insert_many = Mock(side_effect=[None, AutoReconnect(), None])
+        tracked = []
+
+        with self.assertRaises(AutoReconnect):
+            insert_documents(collection, docs, max_count=2, track=tracked.append)
+
+        # The failed batch may have been partly inserted, so it's tracked too.
+        self.assertEqual([[doc["_id"] for doc in docs[:2]], [doc["_id"] for doc in docs[2:4]]],
+                         tracked)
+
+    def test_raw_documents(self):
+        doc_id = ObjectId()
+        raw = RawBSONDocument(BSON.encode({"name": "x", "_id": doc_id}))
+        self.assertEqual(doc_id, document_id(raw))
+        self.assertEqual(len(raw.raw), encoded_size(raw))
+        other = RawBSONDocument(BSON.encode({"_id": "name"}))
+        self.assertEqual("name", document_id(other))
+        self.assertEqual(doc_id, document_id({"_id": doc_id}))
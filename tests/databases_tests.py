@@ -0,0 +1,148 @@
+from unittest import TestCase
+from monufacture import (factory, default, create, build, cleanup, reset, get_factory,
+                         use_database, use_worker_database, in_memory, MemoryDatabase)
+from monufacture import databases, pytest_plugin
+from monufacture.unittest import enable_worker_database
+from mock import Mock, MagicMock, patch
+import os
+
+
+class TestDatabases(TestCase):
+
+    def setUp(self):
+        with factory("user", "users"):
+            default({"name": "John"})
+
+    def tearDown(self):
+        use_database(None)
+        reset()
+        os.environ.pop("MONUFACTURE_WORKER", None)
+        os.environ.pop("PYTEST_XDIST_WORKER", None)
+
+    def test_unresolved(self):
+        self.assertEqual("users", get_factory("user").collection_name)
+        self.assertEqual({"name": "John"}, build("user"))
+        with self.assertRaises(IOError):
+            create("user")
+
+    def test_resolved_per_database(self):
+        first = MemoryDatabase("first")
+        second = MemoryDatabase("second")
+
+        use_database(first)
+        user = create("user")
+        self.assertIs(first["users"], get_factory("user").collection)
+        self.assertEqual(user, first["users"].find_one(user["_id"]))
+
+        # Switching cleans up the documents created in the first database.
+        use_database(second)
+        self.assertEqual(0, len(first["users"]))
+        create("user")
+        self.assertEqual(1, len(second["users"]))
+        cleanup()
+        self.assertEqual(0, len(second["users"]))
+
+    def test_provider_function(self):
+        memory = MemoryDatabase()
+        provider = Mock(return_value=memory)
+        use_database(provider)
+        create("user")
+        create("user")
+        self.assertEqual(1, provider.call_count)
+        self.assertEqual(2, len(memory["users"]))
+
+    def test_collection_object_replaces_name(self):
+        collection = Mock()
+        get_factory("user").collection = collection
+        self.assertIsNone(get_factory("user").collection_name)
+        self.assertIs(collection, get_factory("user").collection)
+
+    def test_in_memory(self):
+        memory = in_memory()
+        create("user")
+        self.assertEqual(1, len(memory["users"]))
+        in_memory(False)
+        self.assertEqual("users", get_factory("user").collection_name)
+
+    def test_worker_database(self):
+        client = MagicMock()
+        self.assertEqual("monufacture_test_main", databases.worker_database_name("monufacture_test"))
+        os.environ["PYTEST_XDIST_WORKER"] = "gw3"
+        self.assertEqual("base_gw3", databases.worker_database_name("base"))
+        os.environ["MONUFACTURE_WORKER"] = "w1"
+        database = use_worker_database(client, "base")
+        client.__getitem__.assert_called_once_with("base_w1")
+        self.assertIs(database, databases.database())
+
+    def test_drop_databases(self):
+        client = Mock()
+        client.list_database_names.return_value = [
+            "base_gw0", "base_gw12", "base_main", "base", "other_gw0", "base_staging",
+            "base_reports", "base_gw", "base_gw1x", "base.x_gw0"]
+        self.assertEqual(["base_gw0", "base_gw12", "base_main"],
+                         databases.drop_databases(client, "base"))
+        self.assertEqual(["base_gw0", "base_gw12", "base_main"],
+                         [c[0][0] for c in client.drop_database.call_args_list])
+
+    @patch("atexit.register")
+    def test_enable_worker_database(self, register):
+        client = MagicMock()
+        client.__getitem__.return_value.name = "suite_w2"
+        os.environ["MONUFACTURE_WORKER"] = "w2"
+        database = enable_worker_database(client, "suite")
+        self.assertIs(database, enable_worker_database(client, "suite"))
+        register.assert_called_once_with(client.drop_database, "suite_w2")
+        self.assertIs(database, databases.database())
+
+
+class TestPytestPlugin(TestCase):
+
+    def config(self, worker=None, dist="no", uri="mongodb://localhost"):
+        config = Mock(spec=["getoption", "getini", "option"])
+        options = {"monufacture_uri": uri, "monufacture_database": None}
+        config.getoption.side_effect = options.get
+        config.getini.side_effect = {"monufacture_uri": "", "monufacture_database": "base"}.get
+        config.option.dist = dist
+        if worker:
+            config.workerinput = {"workerid": worker}
+        return config
+
+    def tearDown(self):
+        use_database(None)
+        os.environ.pop("PYTEST_XDIST_WORKER", None)
+
+    @patch("pymongo.MongoClient")
+    def test_disabled_without_uri(self, client_class):
+        config = self.config(uri=None)
+        pytest_plugin.pytest_configure(config)
+        pytest_plugin.pytest_unconfigure(config)
+        self.assertFalse(client_class.called)
+
+    @patch("pymongo.MongoClient")
+    def test_single_process(self, client_class):
+        client = client_class.return_value
+        config = self.config()
+        pytest_plugin.pytest_configure(config)
+        client.__getitem__.assert_called_once_with("base_main")
+        self.assertIs(client.__getitem__.return_value, databases.database())
+
+        pytest_plugin.pytest_unconfigure(config)
+        client.drop_database.assert_called_once_with("base_main")
+        self.assertIsNone(databases.database())
+
+    @patch("pymongo.MongoClient")
+    def test_xdist(self, client_class):
+        client = client_class.return_value
+        os.environ["PYTEST_XDIST_WORKER"] = "gw1"
+        worker = self.config(worker="gw1", dist="load")
+        pytest_plugin.pytest_configure(worker)
+        client.__getitem__.assert_called_once_with("base_gw1")
+        pytest_plugin.pytest_unconfigure(worker)
+        self.assertFalse(client.drop_database.called)
+
+        client.list_database_names.return_value = ["base_gw0", "base_gw1"]
+        controller = self.config(dist="load")
+        pytest_plugin.pytest_configure(controller)
+        self.assertEqual(1, client.__getitem__.call_count)
+        pytest_plugin.pytest_unconfigure(controller)
+        self.assertEqual(2, client.drop_database.call_count)
@@ -0,0 +1,113 @@
+from unittest import TestCase
+import monufacture
+from monufacture import reset, register, discover, get_factory, build, startup_report
+from monufacture.discovery import find_declarations, scan
+from StringIO import StringIO
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+USERS = '''
+from monufacture import factory, default
+import monufacture
+
+with factory("user", None):
+    default({"name": "John"})
+
+with monufacture.factory("admin"):
+    default({"name": "Root"})
+'''
+
+COMPANIES = '''
+from monufacture import factory, default
+
+NAME = "dynamic"
+
+with factory("company"):
+    default({"name": "GloboCorp"})
+
+with factory(NAME):
+    default({})
+'''
+
+
+class TestDiscovery(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        package = os.path.join(self.directory, "lazy_factories")
+        os.makedirs(os.path.join(package, "nested"))
+        for path, source in [("__init__.py", ""), ("users.py", USERS),
+                             ("nested/__init__.py", ""), ("nested/companies.py", COMPANIES)]:
+            with open(os.path.join(package, path), "w") as f:
+                f.write(source)
+        sys.path.insert(0, self.directory)
+
+    def tearDown(self):
+        reset()
+        monufacture.registry.clear()
+        del monufacture.import_times[:]
+        sys.path.remove(self.directory)
+        for name in list(sys.modules):
+            if name.startswith("lazy_factories"):
+                del sys.modules[name]
+        shutil.rmtree(self.directory)
+
+    def test_find_declarations(self):
+        self.assertEqual(["user", "admin"], find_declarations(USERS))
+        self.assertEqual(["company"], find_declarations(COMPANIES))
+
+    def test_scan(self):
+        self.assertEqual({"user": "lazy_factories.users",
+                          "admin": "lazy_factories.users",
+                          "company": "lazy_factories.nested.companies"},
+                         scan("lazy_factories"))
+        self.assertEqual({"company": "lazy_factories.nested.companies"},
+                         scan("lazy_factories.nested.companies"))
+        self.assertNotIn("lazy_factories", sys.modules)
+
+    def test_imported_on_first_use(self):
+        self.assertEqual(["admin", "company", "user"], discover("lazy_factories"))
+        self.assertNotIn("lazy_factories.users", sys.modules)
+
+        self.assertEqual({"name": "John"}, build("user"))
+        self.assertIn("lazy_factories.users", sys.modules)
+        self.assertNotIn("lazy_factories.nested.companies", sys.modules)
+        self.assertIn("admin", monufacture.factories)
+        self.assertEqual(1, len(monufacture.import_times))
+
+        self.assertIs(get_factory("admin"), get_factory("admin"))
+        self.assertEqual(1, len(monufacture.import_times))
+
+    def test_reloaded_after_reset(self):
+        register("lazy_factories.nested.companies", "company")
+        get_factory("company")
+        reset()
+        self.assertEqual({"name": "GloboCorp"}, build("company"))
+
+    def test_unknown(self):
+        with self.assertRaises(KeyError):
+            get_factory("nobody")
+
+    def test_startup_report(self):
+        discover("lazy_factories")
+        build("user")
+        out = StringIO()
+        startup_report(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith("lazy_factories.users"))
+        self.assertTrue(lines[1].endswith("admin, user"))
+        self.assertTrue(lines[2].startswith("1 of 2 registered modules imported"))
+
+
+class TestLazyImports(TestCase):
+
+    def test_helpers_import_no_dependencies(self):
+        code = ("import sys, monufacture.helpers; "
+                "print sorted(set(m.split('.')[0] for m in sys.modules if sys.modules[m]) & "
+                "set(['pymongo', 'bson', 'pytz']))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+        self.assertEqual("[]", out.strip())
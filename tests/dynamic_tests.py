@@ -1,5 +1,5 @@
 from unittest import TestCase
-from monufacture.dynamic import DynamicDict
+from monufacture.dynamic import DynamicDict, is_static
 
 class TestDynamicDict(TestCase):
 
@@ -178,3 +178,31 @@ class TestDynamicDict(TestCase):
         }
 
         self.assertEqual(expected, doc.resolve())
+
+    def test_is_static(self):
+        self.assertTrue(is_static({"a": [1, {"b": 2}]}))
+        self.assertFalse(is_static({"a": [1, {"b": lambda node: 2}]}))
+
+    def test_resolve_copies_static_values(self):
+        inner = {"b": [1, {"c": 2}]}
+        d = DynamicDict({"a": inner, "x": lambda node: node["a"]["b"][1]["c"]},
+                        static=frozenset(["a"]))
+
+        out = d.resolve()
+
+        self.assertEqual({"a": {"b": [1, {"c": 2}]}, "x": 2}, out)
+        self.assertIsNot(inner, out["a"])
+        self.assertIsNot(inner["b"], out["a"]["b"])
+        self.assertIsNot(inner["b"][1], out["a"]["b"][1])
+        self.assertNotIsInstance(out["a"], DynamicDict)
+
+    def test_functions_called_once(self):
+        calls = []
+
+        def some_func(node):
+            calls.append(1)
+            return {"nested": "value"}
+
+        d = DynamicDict({"a": some_func, "b": lambda node: node["a"]["nested"]})
+        self.assertEqual({"a": {"nested": "value"}, "b": "value"}, d.resolve())
+        self.assertEqual(1, len(calls))
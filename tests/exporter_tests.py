@@ -0,0 +1,73 @@
+from unittest import TestCase
+from monufacture import factory, default, reset, export, Exporter
+from monufacture.helpers import id_of, sequence
+from bson import decode_all, json_util
+from bson.objectid import ObjectId
+from mock import Mock, patch
+import gzip
+import os
+import shutil
+import tempfile
+
+
+class TestExporter(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.companies = Mock()
+        self.companies.name = "companies"
+
+        with factory("company", self.companies):
+            default({"name": sequence(lambda n: "Company %d" % n)})
+
+        with factory("user"):
+            default({"n": sequence(), "company_id": id_of("company")})
+
+    def tearDown(self):
+        reset()
+        shutil.rmtree(self.directory)
+
+    def read_jsonl(self, path):
+        with open(path) as f:
+            return [json_util.loads(line) for line in f]
+
+    def test_jsonl(self):
+        paths = export(3, "user", directory_=self.directory)
+        self.assertEqual({"user": os.path.join(self.directory, "user.json"),
+                          "companies": os.path.join(self.directory, "companies.json")}, paths)
+
+        users = self.read_jsonl(paths["user"])
+        companies = self.read_jsonl(paths["companies"])
+        self.assertEqual([1, 2, 3], [user["n"] for user in users])
+        self.assertIsInstance(users[0]["_id"], ObjectId)
+        self.assertEqual([company["_id"] for company in companies],
+                         [user["company_id"] for user in users])
+        self.assertFalse(self.companies.insert.called)
+        self.assertFalse(self.companies.insert_many.called)
+
+    def test_bson_compressed(self):
+        paths = export(2, "user", directory_=self.directory, format_="bson", compress_=True)
+        self.assertTrue(paths["user"].endswith("user.bson.gz"))
+        with gzip.open(paths["user"]) as f:
+            users = decode_all(f.read())
+        self.assertEqual([1, 2], [user["n"] for user in users])
+
+    def test_overrides_and_counts(self):
+        with Exporter(self.directory) as exporter:
+            exporter.export(2, "user", n=10)
+            counts = exporter.export(1, "company")
+        self.assertEqual({"user": 2, "companies": 3}, counts)
+        users = self.read_jsonl(exporter.paths["user"])
+        self.assertEqual([10, 10], [user["n"] for user in users])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Exporter(self.directory, format="csv")
+
+    def test_jsonl_without_json_options(self):
+        old_json_util = Mock(spec=["dumps"])
+        old_json_util.dumps.side_effect = lambda doc: json_util.dumps(doc)
+        with patch("monufacture.exporter.json_util", old_json_util):
+            paths = export(2, "user", directory_=self.directory)
+        users = self.read_jsonl(paths["user"])
+        self.assertEqual([1, 2], [user["n"] for user in users])
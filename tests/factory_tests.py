@@ -655,12 +655,11 @@ class TestFactory(unittest.TestCase):
         factory.cleanup()
 
         expected_calls = []
-        self.assertEqual(self.collection.remove.mock_calls, expected_calls)
+        self.assertEqual(self.collection.delete_many.mock_calls, expected_calls)
 
     def test_cleanup(self):
         ids = [ObjectId() for x in range(3)]
         cleanup_ids = copy(ids)
-        cleanup_ids.reverse()
 
         def insert_results(*args, **kwargs):
             return ids.pop(0)
@@ -685,12 +684,219 @@ class TestFactory(unittest.TestCase):
 
         factory.cleanup()
 
-        expected_calls = [call(oid) for oid in cleanup_ids]
-        self.assertEqual(self.collection.remove.mock_calls, expected_calls)
+        expected_calls = [call({"_id": {"$in": cleanup_ids}})]
+        self.assertEqual(self.collection.delete_many.mock_calls, expected_calls)
         self.collection.reset_mock()
         factory.cleanup()
-        self.assertFalse(self.collection.remove.called)
+        self.assertFalse(self.collection.delete_many.called)
+
+    def test_cleanup_in_batches(self):
+        ids = [ObjectId() for x in range(25000)]
+        factory = Factory(self.collection)
+        factory.track_created(ids)
+
+        factory.cleanup()
+
+        expected_calls = [call({"_id": {"$in": ids[:10000]}}),
+                          call({"_id": {"$in": ids[10000:20000]}}),
+                          call({"_id": {"$in": ids[20000:]}})]
+        self.assertEqual(self.collection.delete_many.mock_calls, expected_calls)
+
+    def test_created_marks_factory_dirty(self):
+        dirty = set()
+        factory = Factory(self.collection, dirty=dirty)
+        factory.default({})
+
+        factory.create()
+        self.assertEqual(set([factory]), dirty)
+        factory.cleanup()
+        self.assertEqual(set(), dirty)
 
     def test_get_collection(self):
         factory = Factory(self.collection)
         self.assertEqual(self.collection, factory.collection)
+
+    def test_plan_is_cached_between_builds(self):
+        factory = Factory(self.collection)
+        factory.trait("versioned", {"v": 3})
+        factory.default({"wheels": 4}, traits=["versioned"])
+        factory.document("mazda", {"make": "Mazda"}, parent="default")
+
+        plan = factory.plan("document", "mazda")
+        factory.build("mazda")
+        self.assertIs(plan, factory.plan("document", "mazda"))
+        self.assertDictEqual(plan.attrs, {"wheels": 4, "v": 3, "make": "Mazda"})
+        self.assertEqual(plan.origins["v"], "trait:versioned")
+        self.assertEqual(plan.declarations,
+                         ["trait:versioned", "document:default", "document:mazda"])
+
+    def test_plan_is_invalidated_by_declarations(self):
+        factory = Factory(self.collection)
+        factory.trait("versioned", {"v": 3})
+        factory.default({"wheels": 4}, traits=["versioned"])
+        self.assertDictEqual(factory.build(), {"wheels": 4, "v": 3})
+
+        factory.trait("versioned", {"v": 4})
+        self.assertDictEqual(factory.build(), {"wheels": 4, "v": 4})
+
+    def test_builds_do_not_share_nested_values(self):
+        factory = Factory(self.collection)
+        factory.default({"tags": ["a"], "prefs": {"sms": True}})
+        doc = factory.build()
+        doc["tags"].append("b")
+        doc["prefs"]["sms"] = False
+        self.assertDictEqual(factory.build(), {"tags": ["a"], "prefs": {"sms": True}})
+
+    def test_describe(self):
+        factory = Factory(self.collection)
+        factory.trait("versioned", {"v": 3})
+        factory.default({"make": lambda doc: "Mazda"}, traits=["versioned"])
+        description = factory.describe()
+        self.assertIn("default (2 attributes from 2 declarations", description)
+        self.assertRegexpMatches(description, r"make\s+dynamic\s+document:default")
+        self.assertRegexpMatches(description, r"v\s+static\s+trait:versioned")
+
+    def test_create_many(self):
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John"})
+        factory.batch_size = 2
+
+        created = factory.create_many(3, first_name="Mike")
+
+        self.assertEqual(3, len(created))
+        self.assertEqual(2, len(self.collection.insert_many.mock_calls))
+        self.collection.insert_many.assert_called_with([created[2]], ordered=True)
+        self.assertEqual([doc["_id"] for doc in created], factory.created_ids)
+        self.assertEqual("Mike", created[0]["first_name"])
+        self.assertFalse(self.collection.find_one.called)
+
+    def test_build_raw(self):
+        from bson import BSON
+        factory = Factory(self.collection)
+        factory.default({
+            "first_name": "John",
+            "address": {"city": "Paris", "tags": ["a", "b"]},
+            "name": lambda doc: doc["first_name"] + " Smith"
+        })
+
+        raw = factory.build_raw()
+        doc = BSON(raw.raw).decode()
+
+        self.assertEqual("\x07_id\x00", raw.raw[4:9])
+        self.assertIsInstance(doc.pop("_id"), ObjectId)
+        self.assertEqual(factory.build(), doc)
+
+    def test_build_raw_with_overrides(self):
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John", "age": 32})
+        doc_id = ObjectId()
+
+        raw = factory.build_raw(_id=doc_id, age=lambda doc: 40)
+
+        self.assertEqual(doc_id, raw["_id"])
+        self.assertEqual(40, raw["age"])
+        self.assertEqual("John", raw["first_name"])
+        self.assertEqual(32, factory.build_raw()["age"])
+
+    def test_create_many_raw(self):
+        from bson.raw_bson import RawBSONDocument
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John"})
+
+        created = factory.create_many(3, raw_=True, last_name="Smith")
+
+        self.collection.insert_many.assert_called_with(created, ordered=True)
+        self.assertIsInstance(created[0], RawBSONDocument)
+        self.assertEqual("Smith", created[0]["last_name"])
+        self.assertEqual([doc["_id"] for doc in created], factory.created_ids)
+
+    def test_create_many_tracks_batches_inserted_before_a_failure(self):
+        from pymongo.errors import AutoReconnect
+        self.collection.insert_many = Mock(side_effect=[None, AutoReconnect()])
+        factory = Factory(self.collection)
+        factory.default({})
+        factory.batch_size = 2
+
+        with self.assertRaises(AutoReconnect):
+            factory.create_many(4)
+        self.assertEqual(4, len(factory.created_ids))
+
+    def test_create_many_unordered_with_errors(self):
+        from pymongo.errors import BulkWriteError
+        from monufacture.factory import BulkCreateException
+
+        def insert_many(batch, ordered):
+            if batch[0]["n"] == 0:
+                raise BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "dup"}]})
+
+        self.collection.insert_many = Mock(side_effect=insert_many)
+        factory = Factory(self.collection)
+        factory.default({"n": 0})
+        factory.batch_size = 2
+
+        with self.assertRaises(BulkCreateException) as context:
+            factory.create_many(2, ordered_=False)
+        self.assertEqual(1, len(context.exception.created_ids))
+        self.assertEqual(context.exception.created_ids, factory.created_ids)
+        self.assertEqual(1, context.exception.errors[0]["index"])
+
+    def test_create_without_read_back(self):
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John"})
+
+        created = factory.create(read_back_=False)
+
+        self.collection.insert.assert_called_with(created)
+        self.assertIsInstance(created["_id"], ObjectId)
+        self.assertFalse(self.collection.find_one.called)
+
+    def test_create_without_read_back_per_factory(self):
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John"})
+        factory.read_back = False
+
+        factory.create()
+        self.assertFalse(self.collection.find_one.called)
+        factory.create(read_back_=True)
+        self.assertTrue(self.collection.find_one.called)
+
+    def test_create_concurrently(self):
+        ids = dict((n, ObjectId()) for n in range(20))
+        self.collection.insert = Mock(side_effect=lambda doc: ids[doc["n"]])
+        self.collection.find_one = Mock(side_effect=lambda oid: {"_id": oid})
+        counter = iter(range(20))
+        factory = Factory(self.collection)
+        factory.default({"n": lambda doc: next(counter)})
+
+        created = factory.create_concurrently(20, 4)
+
+        self.assertEqual([{"_id": ids[n]} for n in range(20)], created)
+        self.assertEqual(sorted(ids.values()), sorted(factory.created_ids))
+
+    def test_iter_build(self):
+        factory = Factory(self.collection)
+        factory.default({"first_name": "John"})
+        docs = factory.iter_build(2, first_name="Mike")
+        self.assertEqual({"first_name": "Mike"}, next(docs))
+        self.assertEqual([{"first_name": "Mike"}], list(docs))
+
+    def test_iter_create(self):
+        counter = iter(range(10))
+        factory = Factory(self.collection)
+        factory.default({"n": lambda doc: next(counter)})
+        factory.batch_size = 3
+        factory.pipeline_depth = 1
+
+        created = factory.iter_create(10)
+
+        self.assertEqual(0, next(created)["n"])
+        self.assertLessEqual(len(self.collection.insert_many.mock_calls), 3)
+        self.assertEqual(range(1, 10), [doc["n"] for doc in created])
+        self.assertEqual(4, len(self.collection.insert_many.mock_calls))
+        self.assertEqual(10, len(factory.created_ids))
+
+    def test_iter_create_untracked(self):
+        factory = Factory(self.collection)
+        factory.default({})
+        self.assertEqual(5, len(list(factory.iter_create(5, track_=False))))
+        self.assertEqual([], factory.created_ids)
@@ -0,0 +1,105 @@
+from unittest import TestCase
+from monufacture import factory, default, create, build, reset, deferred, get_factory
+from monufacture.helpers import id_of, dbref_to
+from mock import Mock
+from bson.objectid import ObjectId
+from bson.dbref import DBRef
+
+
+class TestDeferredGraph(TestCase):
+
+    def setUp(self):
+        self.users = Mock()
+        self.users.name = "users"
+        self.companies = Mock()
+        self.companies.name = "companies"
+        self.countries = Mock()
+        self.countries.name = "countries"
+
+        with factory("country", self.countries):
+            default({"name": "US"})
+
+        with factory("company", self.companies):
+            default({"name": "GloboCorp", "country_id": id_of("country")})
+
+        with factory("user", self.users):
+            default({
+                "company_id": id_of("company"),
+                "employer": dbref_to("company"),
+                "country_id": id_of("country")
+            })
+
+    def tearDown(self):
+        reset()
+
+    def test_build_is_pure(self):
+        with deferred(persist=False) as graph:
+            user = build("user")
+
+        self.assertEqual(5, len(graph))
+        self.assertIsInstance(user["company_id"], ObjectId)
+        self.assertIsInstance(user["employer"], DBRef)
+        for collection in (self.users, self.companies, self.countries):
+            self.assertFalse(collection.insert.called)
+            self.assertFalse(collection.insert_many.called)
+
+    def test_documents_in_dependency_order(self):
+        with deferred(persist=False) as graph:
+            user = create("user")
+
+        groups = graph.documents()
+        self.assertEqual([self.countries, self.companies, self.users],
+                         [collection for collection, entries in groups])
+        self.assertEqual(user, groups[2][1][0][1])
+        company_ids = [doc["_id"] for factory, doc in groups[1][1]]
+        self.assertIn(user["company_id"], company_ids)
+        self.assertEqual(user["employer"].id, company_ids[1])
+
+    def test_persist_one_insert_per_collection(self):
+        with deferred():
+            users = [create("user") for x in range(3)]
+
+        self.assertEqual(1, len(self.users.insert_many.mock_calls))
+        self.assertEqual(1, len(self.companies.insert_many.mock_calls))
+        self.assertEqual(1, len(self.countries.insert_many.mock_calls))
+        self.assertEqual(users, self.users.insert_many.call_args[0][0])
+        self.assertEqual(9, len(self.countries.insert_many.call_args[0][0]))
+        self.assertEqual([user["_id"] for user in users], get_factory("user").created_ids)
+        self.assertEqual(6, len(get_factory("company").created_ids))
+
+    def test_nested_block_persisted_with_outer(self):
+        with deferred() as outer:
+            create("user")
+            with deferred():
+                create("user")
+            self.assertEqual(12, len(outer))
+            self.assertFalse(self.users.insert_many.called)
+
+        self.assertEqual(1, len(self.users.insert_many.mock_calls))
+        self.assertEqual(2, len(self.users.insert_many.call_args[0][0]))
+        self.assertEqual(6, len(self.countries.insert_many.call_args[0][0]))
+
+    def test_nested_block_not_persisted_on_outer_error(self):
+        with self.assertRaises(ValueError):
+            with deferred():
+                with deferred():
+                    create("user")
+                raise ValueError()
+        self.assertFalse(self.users.insert_many.called)
+
+    def test_not_persisted_on_error(self):
+        with self.assertRaises(ValueError):
+            with deferred():
+                create("user")
+                raise ValueError()
+        self.assertFalse(self.users.insert_many.called)
+
+    def test_persist_without_collection(self):
+        with factory("note"):
+            default({"text": "hi"})
+
+        with deferred(persist=False) as graph:
+            note = create("note")
+        self.assertEqual("hi", note["text"])
+        with self.assertRaises(IOError):
+            graph.persist()
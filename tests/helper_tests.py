@@ -3,7 +3,7 @@ import calendar
 import unittest
 import monufacture.dynamic
 from monufacture.helpers import (
-    sequence, dependent, id_of, text, random_text, dbref_to, date,
+    sequence, dependent, id_of, text, random_text, dbref_to, date, DependencyPool,
     now, ago, from_now, list_of, object_id, union, one_of,
     random_number, number)
 from mock import patch, Mock, call
@@ -37,6 +37,14 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(1, func())
         self.assertEqual(2, func())
 
+    def test_sequence_is_thread_safe(self):
+        from multiprocessing.pool import ThreadPool
+        func = sequence()
+        pool = ThreadPool(8)
+        values = pool.map(lambda n: func(), range(1000))
+        pool.close()
+        self.assertEqual(range(1, 1001), sorted(values))
+
     def test_dependent(self):
         func = dependent(lambda doc: "%s %s" % (doc['first'], doc['last']))
         doc_a = {'first': 'John', 'last': 'Smith'}
@@ -78,6 +86,49 @@ class TestHelperFunctions(unittest.TestCase):
             create.mock_calls)
 
 
+    @patch('monufacture.create')
+    def test_id_of_with_pool(self, create):
+        create.side_effect = [{"_id": n} for n in range(4)]
+        pool = DependencyPool(size=2)
+        func = id_of("bob", reuse_=pool)
+        self.assertEqual([0, 1, 0, 1], [func() for x in range(4)])
+        self.assertEqual([call("bob", None), call("bob", None)], create.mock_calls)
+
+        pool.clear()
+        self.assertEqual(2, func())
+
+    @patch('monufacture.create')
+    def test_id_of_with_random_pool(self, create):
+        create.side_effect = [{"_id": n} for n in range(5)]
+        func = id_of("bob", reuse_=DependencyPool(size=5, order="random"))
+        self.assertEqual(set(range(5)), set(func() for x in range(200)))
+
+    @patch('monufacture.create')
+    def test_id_of_with_pool_keyed_by_overrides(self, create):
+        create.side_effect = lambda f, d, **o: {"_id": o["flavor"]}
+        func = id_of("bob", reuse_=DependencyPool(size=1), flavor=lambda n: n['flavor'])
+        self.assertEqual("ham", func({"flavor": "ham"}))
+        self.assertEqual("cheese", func({"flavor": "cheese"}))
+        self.assertEqual("ham", func({"flavor": "ham"}))
+        self.assertEqual(2, len(create.mock_calls))
+
+    @patch('monufacture.create')
+    def test_id_of_shared_per_document(self, create):
+        create.side_effect = [{"_id": n} for n in range(4)]
+        spec = {"a": id_of("bob", reuse_="document"),
+                "b": id_of("bob", reuse_="document"),
+                "c": {"d": id_of("bob", reuse_="document")},
+                "e": id_of("bob", "other", reuse_="document")}
+
+        doc = monufacture.dynamic.DynamicDict(spec).resolve()
+        self.assertEqual(doc["a"], doc["b"])
+        self.assertEqual(doc["a"], doc["c"]["d"])
+        self.assertNotEqual(doc["a"], doc["e"])
+
+        doc = monufacture.dynamic.DynamicDict(spec).resolve()
+        self.assertEqual(doc["a"], doc["b"])
+        self.assertEqual(4, len(create.mock_calls))
+
     @patch('monufacture.helpers.random_text')
     def test_text(self, random_text):
         func = text(length=1, lower=True, upper=True, digits=True,
@@ -99,6 +150,11 @@ class TestHelperFunctions(unittest.TestCase):
         text = func()
         self.assertEqual(15, len(text))
 
+    def test_random_text_of_zero_length(self):
+        func = random_text(0)
+        self.assertEqual("", func())
+        self.assertEqual(["", ""], func.batch(2))
+
     def test_random_text_with_spaces(self):
         func = random_text(1000, spaces=True)
         text = func()
@@ -127,6 +183,36 @@ class TestHelperFunctions(unittest.TestCase):
         text = func()
         self.assertRegexpMatches(text, r'^[a-z]{1000}$')
 
+    def test_random_text_batch(self):
+        texts = random_text(20, digits=True).batch(50)
+        self.assertEqual(50, len(texts))
+        self.assertEqual(50, len(set(texts)))
+        for text in texts:
+            self.assertRegexpMatches(text, r'^[a-zA-Z0-9]{20}$')
+
+    def test_random_text_in_dynamic_dict(self):
+        doc = monufacture.dynamic.DynamicDict({"name": random_text(12)}).resolve()
+        self.assertRegexpMatches(doc["name"], r'^[a-zA-Z]{12}$')
+
+    def test_random_text_uses_every_char(self):
+        text = random_text(5000, upper=False, lower=False, digits=True)()
+        self.assertEqual(set("0123456789"), set(text))
+
+    def test_random_text_with_multibyte_chars(self):
+        func = random_text(100, upper=False, lower=False, other_chars=[u"\xe9", u"\xfc"])
+        self.assertRegexpMatches(func(), u'^[\xe9\xfc]{100}$')
+        self.assertEqual(3, len(func.batch(3)))
+
+    @patch('monufacture.create')
+    @patch('monufacture.get_factory')
+    def test_dbref_to_with_pool(self, get_factory, create):
+        get_factory.return_value.collection.name = "users"
+        create.side_effect = [{"_id": 1}, {"_id": 2}]
+        func = dbref_to("user", reuse_=DependencyPool(size=1))
+        self.assertEqual(DBRef("users", 1), func())
+        self.assertEqual(DBRef("users", 1), func())
+        self.assertEqual(1, len(create.mock_calls))
+
     @patch('monufacture.create')
     @patch('monufacture.get_factory')
     def test_dbref_to(self, get_factory, create):
@@ -0,0 +1,200 @@
+from unittest import TestCase
+import monufacture
+from monufacture import (factory, default, create, create_list, cleanup, reset,
+                         in_memory, get_factory, MemoryCollection, BulkCreateException)
+from monufacture.helpers import id_of
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from bson.objectid import ObjectId
+from mock import Mock
+
+
+class TestMemoryCollection(TestCase):
+
+    def setUp(self):
+        self.collection = MemoryCollection("users")
+        self.collection.insert_many([
+            {"_id": 1, "name": "Ann", "age": 30, "tags": ["a", "b"],
+             "address": {"city": "Paris"}},
+            {"_id": 2, "name": "Bob", "age": 25, "tags": ["b"],
+             "address": {"city": "London"}, "pets": [{"kind": "cat"}, {"kind": "dog"}]},
+            {"_id": 3, "name": "Cat", "age": None}
+        ])
+
+    def names(self, spec):
+        return [doc["name"] for doc in self.collection.find(spec)]
+
+    def test_names(self):
+        self.assertEqual("users", self.collection.name)
+        self.assertEqual("memory.users", self.collection.full_name)
+        self.assertTrue(MemoryCollection())
+
+    def test_insert_assigns_id(self):
+        doc = {"name": "Dan"}
+        doc_id = self.collection.insert(doc)
+        self.assertIsInstance(doc_id, ObjectId)
+        self.assertEqual(doc_id, doc["_id"])
+        self.assertEqual(doc, self.collection.find_one(doc_id))
+        self.assertEqual([4, 5], self.collection.insert([{"_id": 4}, {"_id": 5}]))
+
+    def test_insert_one_and_find_one_by_id(self):
+        result = self.collection.insert_one({"name": "Dan"})
+        self.assertEqual("Dan", self.collection.find_one(result.inserted_id)["name"])
+        self.assertEqual("Dan", self.collection.find_one({"_id": result.inserted_id})["name"])
+        self.assertIsNone(self.collection.find_one(ObjectId()))
+
+    def test_returns_copies(self):
+        doc = self.collection.find_one(1)
+        doc["address"]["city"] = "Rome"
+        self.assertEqual("Paris", self.collection.find_one(1)["address"]["city"])
+
+    def test_duplicate_id(self):
+        with self.assertRaises(DuplicateKeyError):
+            self.collection.insert({"_id": 1})
+
+    def test_insert_many_errors(self):
+        with self.assertRaises(BulkWriteError) as context:
+            self.collection.insert_many([{"_id": 4}, {"_id": 1}, {"_id": 5}])
+        errors = context.exception.details["writeErrors"]
+        self.assertEqual([1], [error["index"] for error in errors])
+        self.assertEqual(11000, errors[0]["code"])
+        self.assertEqual(4, self.collection.count())
+
+        with self.assertRaises(BulkWriteError):
+            self.collection.insert_many([{"_id": 2}, {"_id": 6}], ordered=False)
+        self.assertIsNotNone(self.collection.find_one(6))
+
+    def test_filters(self):
+        self.assertEqual(["Ann"], self.names({"name": "Ann"}))
+        self.assertEqual(["Bob"], self.names({"address.city": "London"}))
+        self.assertEqual(["Ann", "Bob"], self.names({"tags": "b"}))
+        self.assertEqual(["Bob"], self.names({"pets.kind": "dog"}))
+        self.assertEqual(["Cat"], self.names({"address": None}))
+        self.assertEqual(["Ann"], self.names({"age": {"$gt": 25}}))
+        self.assertEqual(["Ann", "Bob"], self.names({"age": {"$gte": 25, "$lte": 30}}))
+        self.assertEqual(["Bob", "Cat"], self.names({"age": {"$ne": 30}}))
+        self.assertEqual(["Ann", "Cat"], self.names({"_id": {"$in": [1, 3]}}))
+        self.assertEqual(["Bob"], self.names({"name": {"$nin": ["Ann", "Cat"]}}))
+        self.assertEqual(["Bob"], self.names({"pets": {"$exists": True}}))
+        self.assertEqual(["Ann", "Cat"], self.names({"$or": [{"_id": 1}, {"age": None}]}))
+        self.assertEqual(["Bob"], self.names({"$and": [{"tags": "b"}, {"age": {"$lt": 30}}]}))
+        self.assertEqual(["Cat"], self.names({"$nor": [{"tags": "b"}]}))
+        self.assertEqual(["Ann", "Bob", "Cat"], self.names({}))
+
+    def test_cursor(self):
+        cursor = self.collection.find({"tags": "b"})
+        self.assertEqual(2, cursor.count())
+        self.assertEqual(["Ann", "Bob"], [doc["name"] for doc in cursor])
+        self.assertEqual([], list(cursor))
+        self.assertEqual("Bob", cursor[1]["name"])
+
+    def test_cursor_sort_skip_limit(self):
+        cursor = self.collection.find().sort("age", -1).skip(1).limit(1)
+        self.assertEqual(["Bob"], [doc["name"] for doc in cursor])
+        self.assertEqual(3, cursor.count())
+        self.assertEqual(1, cursor.count(with_limit_and_skip=True))
+        names = [doc["name"] for doc in self.collection.find().sort([("pets", 1), ("name", -1)])]
+        self.assertEqual(["Cat", "Ann", "Bob"], names)
+
+    def test_unsupported_operator(self):
+        with self.assertRaises(OperationFailure):
+            self.collection.find({"name": {"$regex": "A"}})
+
+    def test_delete(self):
+        self.assertEqual(1, self.collection.delete_one({"tags": "b"}).deleted_count)
+        self.assertEqual(["Bob", "Cat"], self.names({}))
+        self.assertEqual(2, self.collection.delete_many({"_id": {"$in": [2, 3, 3, 9]}}).deleted_count)
+        self.assertEqual(0, self.collection.count())
+
+    def test_remove(self):
+        self.assertEqual({"n": 2, "ok": 1.0}, self.collection.remove({"address": {"$exists": True}}))
+        self.assertEqual(["Cat"], self.names({}))
+
+    def test_update(self):
+        self.collection.update_many({"tags": "b"}, {"$inc": {"age": 1}, "$set": {"address.zip": "1"}})
+        self.assertEqual(31, self.collection.find_one(1)["age"])
+        self.assertEqual("1", self.collection.find_one(2)["address"]["zip"])
+        result = self.collection.update_one({"_id": 9}, {"$set": {"name": "Eve"}}, upsert=True)
+        self.assertEqual(9, result.upserted_id)
+        self.assertEqual("Eve", self.collection.find_one(9)["name"])
+
+    def test_find_one_and_update(self):
+        counter = self.collection.find_one_and_update(
+            {"_id": "seq"}, {"$inc": {"value": 10}}, upsert=True,
+            return_document=ReturnDocument.AFTER)
+        self.assertEqual({"_id": "seq", "value": 10}, counter)
+        before = self.collection.find_one_and_update({"_id": "seq"}, {"$inc": {"value": 10}})
+        self.assertEqual(10, before["value"])
+        self.assertEqual(20, self.collection.find_one("seq")["value"])
+
+    def test_indexes_and_drop(self):
+        self.collection.create_index([("name", 1)], unique=True)
+        self.assertIn("name_1", self.collection.index_information())
+        self.collection.drop()
+        self.assertEqual(0, len(self.collection))
+        self.assertEqual(["_id_"], self.collection.index_information().keys())
+
+
+class TestInMemory(TestCase):
+
+    def setUp(self):
+        self.companies = Mock()
+        self.companies.name = "companies"
+
+        with factory("company", self.companies):
+            default({"name": "GloboCorp"})
+
+    def tearDown(self):
+        in_memory(False)
+        reset()
+
+    def test_bound_to_factory(self):
+        users = MemoryCollection("users")
+        with factory("user", users):
+            default({"name": "John"})
+
+        user = create("user")
+        self.assertEqual(user, users.find_one(user["_id"]))
+        cleanup()
+        self.assertEqual(0, len(users))
+
+    def test_swapped_in_globally(self):
+        memory = in_memory()
+
+        with factory("user"):
+            default({"company_id": id_of("company")})
+
+        user = create("user")
+        self.assertEqual(user, memory["user"].find_one(user["_id"]))
+        self.assertIsNotNone(memory["companies"].find_one(user["company_id"]))
+        self.assertFalse(self.companies.insert.called)
+
+        create_list(3, "company", bulk_=True)
+        self.assertEqual(4, len(memory["companies"]))
+
+        cleanup()
+        self.assertEqual(0, len(memory["companies"]))
+        self.assertEqual(0, len(memory["user"]))
+
+    def test_restore(self):
+        in_memory()
+        create("company")
+        in_memory(False)
+        self.assertIs(self.companies, get_factory("company").collection)
+        self.assertIsNone(monufacture.memory)
+
+    def test_read_back_is_not_an_override(self):
+        memory = in_memory()
+        for companies in (create_list(2, "company", bulk_=True, read_back_=False),
+                          create_list(2, "company", workers_=2, read_back_=False),
+                          create_list(2, "company", read_back_=False)):
+            for company in companies:
+                self.assertNotIn("read_back_", company)
+                self.assertNotIn("read_back_", memory["companies"].find_one(company["_id"]))
+        self.assertRaises(ValueError, create_list, 2, "company", bulk_=True, read_back_=True)
+
+    def test_bulk_duplicates(self):
+        in_memory()
+        company = create("company")
+        with self.assertRaises(BulkCreateException):
+            create_list(2, "company", bulk_=True, _id=company["_id"])
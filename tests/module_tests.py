@@ -1,7 +1,7 @@
 import os
 from unittest import TestCase
 import monufacture
-from monufacture import factory, trait, default, document, fragment, embed, build, create, build_list, create_list, cleanup, reset, FactoryContextException, get_factory
+from monufacture import factory, trait, default, document, fragment, embed, build, create, build_list, create_list, cleanup, reset, FactoryContextException, get_factory, iter_build, iter_create
 from monufacture.helpers import dependent, sequence, id_of
 from mock import Mock, patch, ANY
 from bson.objectid import ObjectId
@@ -498,6 +498,45 @@ class TestGeneration(TestCase):
         for expected, actual in zip(expected_docs, created_list):
             self.assertDictContainsSubset(expected, actual)
 
+    def test_create_without_read_back(self):
+        monufacture.read_back = False
+        try:
+            created = create("user", first='Mike')
+        finally:
+            monufacture.read_back = True
+
+        self.assertEqual(created, self.user_collection.find_one(created["_id"]))
+        self.assertFalse(self.company_collection.find_one.called)
+
+    def test_create_list_with_workers(self):
+        created_list = create_list(10, "user", "admin", workers_=4)
+
+        self.assertEqual(range(21, 31), [doc["age"] for doc in created_list])
+        self.assertEqual(10, self.user_collection.find(
+            {"_id": {"$in": [doc["_id"] for doc in created_list]}}).count())
+
+    def test_iter_build(self):
+        docs = iter_build(3, "user", "admin")
+        self.assertEqual(21, next(docs)["age"])
+        self.assertEqual([22, 23], [doc["age"] for doc in docs])
+
+    def test_iter_create(self):
+        get_factory("user").batch_size = 2
+        ages = []
+        for doc in iter_create(5, "user"):
+            self.assertIsNotNone(self.user_collection.find_one(doc["_id"]))
+            ages.append(doc["age"])
+        self.assertEqual(range(21, 26), ages)
+        self.assertEqual(5, len(get_factory("user").created_ids))
+
+    def test_create_list_bulk(self):
+        created_list = create_list(3, "user", "admin", bulk_=True, favorite_color="green")
+
+        self.assertEqual([21, 22, 23], [doc["age"] for doc in created_list])
+        for created in created_list:
+            self.assertEqual("green", self.user_collection.find_one(created["_id"])["favorite_color"])
+        self.assertEqual(len(get_factory("user").created_ids), 3)
+
     def test_build_collectionless_document(self):
         doc = build('fake')
         self.assertEqual(doc, {'fake': True})
@@ -514,6 +553,43 @@ class TestGeneration(TestCase):
         self.assertEqual(before_count, after_count)
 
 
+    def test_cleanup_only_visits_dirty_factories(self):
+        with factory("book", self.company_collection):
+            default({"title": "Dune"})
+        with factory("magazine", self.company_collection):
+            default({"title": "Wired"})
+        with factory("unused", self.company_collection):
+            default({})
+
+        book_id = create("book")["_id"]
+        magazine_id = create("magazine")["_id"]
+        self.assertEqual(set([get_factory("book"), get_factory("magazine")]), monufacture.dirty)
+
+        cleanup()
+
+        self.company_collection.delete_many.assert_called_once_with(
+            {"_id": {"$in": ANY}})
+        ids = self.company_collection.delete_many.call_args[0][0]["_id"]["$in"]
+        self.assertEqual(sorted([book_id, magazine_id]), sorted(ids))
+        self.assertEqual(set(), monufacture.dirty)
+
+    def test_cleanup_empties_dependency_pools(self):
+        from monufacture.helpers import DependencyPool
+        pool = DependencyPool(size=2)
+        pool.get("company")
+        self.assertEqual(2, len(get_factory("company").created_ids))
+        cleanup()
+        self.assertEqual({}, pool.docs)
+
+    def test_cleanup_with_strategy(self):
+        # The ids are only available while the strategy runs.
+        calls = []
+        strategy = Mock(side_effect=lambda pairs: calls.append(
+            [(collection, list(ids)) for collection, ids in pairs]))
+        company_id = create("company")["_id"]
+        cleanup(strategy)
+        self.assertEqual([[(self.company_collection, [company_id])]], calls)
+
     @patch('logging.debug')
     def test_debug_logging(self, debug):
         monufacture.debug = True
@@ -0,0 +1,66 @@
+from unittest import TestCase
+from monufacture import (factory, default, fragment, embed, build, build_list, reset,
+                         declaring_modules, get_factory)
+from monufacture.parallel import iter_build
+from monufacture.factory import WorkerCreateException
+from monufacture.helpers import sequence, dependent, list_of, id_of
+
+
+class TestParallelBuild(TestCase):
+
+    def setUp(self):
+        with factory("user"):
+            default({
+                "username": sequence(lambda n: "user%d" % n),
+                "email": dependent(lambda doc: "%s@test.com" % doc["username"])
+            })
+
+    def tearDown(self):
+        reset()
+
+    def test_declaring_modules(self):
+        self.assertEqual([__name__], declaring_modules())
+
+    def test_build_list_in_processes(self):
+        docs = build_list(50, "user", processes_=3, active=True)
+
+        self.assertEqual(50, len(docs))
+        self.assertEqual(["user%d" % n for n in range(1, 51)],
+                         [doc["username"] for doc in docs])
+        self.assertEqual({"username": "user7", "email": "user7@test.com", "active": True},
+                         docs[6])
+
+    def test_sequences_continue_after_parallel_build(self):
+        build_list(10, "user", processes_=2)
+        self.assertEqual("user11", build("user")["username"])
+
+    def test_build_count_advanced_when_abandoned(self):
+        docs = iter_build(10, "user", processes=2)
+        next(docs)
+        self.assertEqual(10, get_factory("user").build_count)
+        docs.close()
+        self.assertEqual(10, get_factory("user").build_count)
+
+    def test_sequences_used_several_times_per_document_are_unique(self):
+        with factory("item"):
+            fragment("line", {"n": sequence()})
+            default({"lines": list_of(embed("line"), 3)})
+        with factory("other"):
+            default({"email": sequence(lambda n: "u%d@x" % n)})
+
+        docs = build_list(8, "item", processes_=2)
+
+        numbers = [line["n"] for doc in docs for line in doc["lines"]]
+        self.assertEqual(24, len(set(numbers)))
+        self.assertEqual(max(numbers) + 1, build("item")["lines"][0]["n"])
+        self.assertEqual("u1@x", build("other")["email"])
+        self.assertEqual("user1", build("user")["username"])
+
+    def test_dependencies_are_refused_in_workers(self):
+        with factory("team"):
+            default({"name": "Team"})
+        with factory("player"):
+            default({"team_id": id_of("team")})
+
+        with self.assertRaises(WorkerCreateException):
+            build_list(4, "player", processes_=2)
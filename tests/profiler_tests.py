@@ -0,0 +1,83 @@
+from unittest import TestCase
+from monufacture import factory, default, document, create, build, reset, profiling, Profiler
+from monufacture.helpers import id_of
+from mock import Mock
+from StringIO import StringIO
+import time
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        self.companies = Mock()
+        self.users = Mock()
+        self.companies.find_one.return_value = {"_id": 1}
+        self.users.find_one.return_value = {"_id": 2}
+
+        with factory("company", self.companies):
+            default({"name": "GloboCorp"})
+
+        with factory("user", self.users):
+            default({
+                "first": "John",
+                "slow": lambda doc: time.sleep(0.01) or "done",
+                "address": {"city": lambda doc: "Paris"},
+                "tags": [lambda doc: "a", lambda doc: "b"],
+                "company_id": id_of("company")
+            })
+            document("admin", {"role": lambda doc: "admin"}, parent="default")
+
+    def tearDown(self):
+        reset()
+
+    def fields(self, profiler):
+        return dict(((row["factory"], row["document"], row["field"]), row)
+                    for row in profiler.results())
+
+    def test_records_each_function_field(self):
+        with profiling() as profiler:
+            build("user")
+            build("user")
+
+        fields = self.fields(profiler)
+        self.assertIn(("user", "default", "slow"), fields)
+        self.assertIn(("user", "default", "address.city"), fields)
+        self.assertIn(("user", "default", "tags.0"), fields)
+        self.assertIn(("user", "default", "tags.1"), fields)
+        self.assertNotIn(("user", "default", "first"), fields)
+        self.assertEqual(2, fields[("user", "default", "slow")]["calls"])
+        self.assertTrue(fields[("user", "default", "slow")]["total"] >= 0.02)
+        self.assertEqual("slow", profiler.results()[0]["field"])
+
+    def test_attributes_dependencies(self):
+        with profiling() as profiler:
+            create("user", "admin")
+
+        fields = self.fields(profiler)
+        self.assertIn(("user", "admin", "role"), fields)
+        self.assertIn(("user", "admin", "company_id"), fields)
+        self.assertIn(("company", "default", "(insert)"), fields)
+        self.assertIn(("user", "admin", "(insert)"), fields)
+
+    def test_inactive_outside_block(self):
+        with profiling() as profiler:
+            pass
+        build("user")
+        self.assertEqual([], profiler.results())
+
+    def test_accumulates_across_blocks(self):
+        profiler = Profiler()
+        with profiling(profiler):
+            build("user")
+        with profiling(profiler):
+            build("user")
+        self.assertEqual(2, self.fields(profiler)[("user", "default", "slow")]["calls"])
+
+    def test_dump(self):
+        with profiling() as profiler:
+            build("user")
+        out = StringIO()
+        profiler.dump(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("factory"))
+        self.assertIn("address.city", out.getvalue())
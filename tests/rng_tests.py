@@ -0,0 +1,49 @@
+from unittest import TestCase
+import random
+from monufacture import factory, default, build, build_list, reset, seed, get_factory
+from monufacture.helpers import random_text, one_of, random_number
+from monufacture import rng
+
+
+class TestSeededRandom(TestCase):
+
+    def setUp(self):
+        with factory("user"):
+            default({
+                "name": random_text(20),
+                "role": one_of("admin", "staff", "guest"),
+                "age": random_number(18, 99)
+            })
+
+    def tearDown(self):
+        reset()
+        seed(None)
+
+    def test_unseeded_uses_global_random(self):
+        self.assertIs(random, rng.current())
+
+    def test_seeded_builds_are_reproducible(self):
+        seed(42)
+        first = build_list(5, "user")
+        get_factory("user").build_count = 0
+        self.assertEqual(first, build_list(5, "user"))
+
+    def test_document_depends_only_on_index(self):
+        seed(42)
+        docs = build_list(5, "user")
+        get_factory("user").build_count = 3
+        random.random()
+        self.assertEqual(docs[3], build("user"))
+
+    def test_different_seeds_differ(self):
+        seed(1)
+        doc = build("user")
+        seed(2)
+        get_factory("user").build_count = 0
+        self.assertNotEqual(doc, build("user"))
+
+    def test_parallel_build_matches_serial(self):
+        seed(7)
+        serial = build_list(40, "user")
+        get_factory("user").build_count = 0
+        self.assertEqual(serial, build_list(40, "user", processes_=3))
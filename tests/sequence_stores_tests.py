@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+from monufacture.helpers import sequence
+from monufacture.sequence_stores import MongoSequenceStore, FileSequenceStore
+from mock import Mock
+
+
+class TestSequenceStores(unittest.TestCase):
+
+    def test_mongo_store_reserves_blocks(self):
+        collection = Mock()
+        collection.find_one_and_update = Mock(side_effect=[{"value": 3}, {"value": 9}])
+        store = MongoSequenceStore(collection, "users", block_size=3)
+
+        func = sequence(store=store)
+
+        self.assertEqual([1, 2, 3, 7], [func() for x in range(4)])
+        self.assertEqual(2, len(collection.find_one_and_update.mock_calls))
+        self.assertEqual({"$inc": {"value": 3}},
+                         collection.find_one_and_update.call_args[0][1])
+
+    def test_file_store_shares_counter(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            func_a = sequence(lambda n: "user%d" % n, store=FileSequenceStore(path, block_size=2))
+            func_b = sequence(lambda n: "user%d" % n, store=FileSequenceStore(path, block_size=2))
+
+            self.assertEqual("user1", func_a())
+            self.assertEqual("user3", func_b())
+            self.assertEqual("user2", func_a())
+            self.assertEqual("user5", func_a())
+            self.assertEqual("user4", func_b())
+            with open(path) as f:
+                self.assertEqual("6", f.read())
+        finally:
+            os.remove(path)
@@ -0,0 +1,140 @@
+from unittest import TestCase
+from monufacture import (factory, default, document, reset, cleanup, dataset, get_factory,
+                         MemoryCollection, BulkCreateException)
+from monufacture import snapshot
+from monufacture.helpers import id_of, random_number, sequence
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from mock import patch
+import os
+import shutil
+import tempfile
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.companies = MemoryCollection("companies")
+        self.users = MemoryCollection("users")
+        self.declare()
+
+    def declare(self, score=100):
+        with factory("company", self.companies):
+            default({"name": sequence(lambda n: "Company %d" % n)})
+
+        with factory("user", self.users):
+            default({"company_id": id_of("company"), "score": random_number(score)})
+            document("admin", {"admin": True}, parent="default")
+
+    def tearDown(self):
+        reset()
+        shutil.rmtree(self.directory)
+
+    def test_generates_then_restores(self):
+        counts = [("user", 5), ("user", "admin", 2)]
+        manifest = dataset(counts, seed=1, directory=self.directory)
+        self.assertEqual([{"factory": "company", "file": "company.bson", "count": 7},
+                          {"factory": "user", "file": "user.bson", "count": 7}],
+                         manifest["files"])
+        self.assertEqual(7, len(self.users))
+        self.assertEqual(7, len(self.companies))
+        self.assertEqual(2, self.users.count({"admin": True}))
+        first = list(self.users.find({}))
+
+        cleanup()
+        self.assertEqual(0, len(self.users))
+
+        with patch.object(snapshot, "save") as save:
+            dataset(counts, seed=1, directory=self.directory)
+        self.assertFalse(save.called)
+        self.assertEqual(first, list(self.users.find({})))
+        self.assertEqual(7, len(get_factory("user").created_ids))
+
+        cleanup()
+        self.assertEqual(0, len(self.users))
+        self.assertEqual(0, len(self.companies))
+
+    def test_restore_advances_counters(self):
+        counts = [("user", 3)]
+        dataset(counts, directory=self.directory)
+        companies = get_factory("company")
+        first = companies.create(read_back_=False)["name"]
+        cleanup()
+
+        # As in a new process, where the snapshot is found on disk.
+        reset()
+        self.declare()
+        dataset(counts, directory=self.directory)
+        self.assertEqual(first, get_factory("company").create(read_back_=False)["name"])
+        self.assertEqual(3, get_factory("user").build_count)
+
+    def test_restore_never_moves_counters_back(self):
+        counts = [("user", 1)]
+        dataset(counts, directory=self.directory)
+        companies = get_factory("company")
+        for i in range(5):
+            companies.build()
+        cleanup()
+        dataset(counts, directory=self.directory)
+        self.assertEqual("Company 7", companies.build()["name"])
+
+    def test_key(self):
+        counts = [("user", 5)]
+        key = snapshot.key(counts, 1)
+        self.assertEqual(key, snapshot.key(counts, 1))
+        self.assertEqual(key, snapshot.key({"user": 5}, 1))
+        self.assertNotEqual(key, snapshot.key(counts, 2))
+        self.assertNotEqual(key, snapshot.key([("user", 6)], 1))
+        self.assertNotEqual(key, snapshot.key([("user", "admin", 5)], 1))
+
+        reset()
+        self.declare()
+        self.assertEqual(key, snapshot.key(counts, 1))
+
+        reset()
+        self.declare(score=50)
+        self.assertNotEqual(key, snapshot.key(counts, 1))
+
+    def test_seeded(self):
+        save_a = os.path.join(self.directory, "a")
+        save_b = os.path.join(self.directory, "b")
+        snapshot.save(save_a, [("user", 5)], seed=3)
+        get_factory("user").build_count = 0
+        snapshot.save(save_b, [("user", 5)], seed=3)
+        scores = lambda path: [doc["score"] for doc in
+                               snapshot.read_documents(os.path.join(path, "user.bson"))]
+        self.assertEqual(scores(save_a), scores(save_b))
+
+    def test_save_keeps_existing_snapshot(self):
+        path = os.path.join(self.directory, "snapshot")
+        first = snapshot.save(path, [("company", 2)])
+        with open(os.path.join(path, "company.bson"), "rb") as f:
+            data = f.read()
+
+        second = snapshot.save(path, [("company", 2)])
+        self.assertEqual(first["counters"]["build_counts"], second["counters"]["build_counts"])
+        self.assertEqual(4, get_factory("company").build_count)
+        with open(os.path.join(path, "company.bson"), "rb") as f:
+            self.assertEqual(data, f.read())
+        self.assertEqual(["snapshot"], os.listdir(self.directory))
+
+    def test_read_documents(self):
+        path = os.path.join(self.directory, "snapshot")
+        snapshot.save(path, [("company", 3)])
+        docs = list(snapshot.read_documents(os.path.join(path, "company.bson")))
+        self.assertEqual(3, len(docs))
+        self.assertIsInstance(docs[0], RawBSONDocument)
+        self.assertIsInstance(docs[0]["_id"], ObjectId)
+        self.assertEqual(0, len(self.companies))
+
+    def test_restore_errors(self):
+        path = os.path.join(self.directory, "snapshot")
+        snapshot.save(path, [("company", 3)])
+        snapshot.restore(path)
+        with self.assertRaises(BulkCreateException) as context:
+            snapshot.restore(path)
+        self.assertEqual(1, len(context.exception.errors))
+        with self.assertRaises(BulkCreateException) as context:
+            snapshot.restore(path, ordered=False)
+        self.assertEqual(3, len(context.exception.errors))
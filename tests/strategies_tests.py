@@ -0,0 +1,76 @@
+import unittest
+from monufacture import strategies
+from monufacture.strategies import (
+    TrackedIdsStrategy, DeleteAllStrategy, DropStrategy, prepare)
+from mock import Mock
+from bson.objectid import ObjectId
+
+
+class TestCleanupStrategies(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = Mock()
+        self.collection.full_name = "test.users"
+
+    def tearDown(self):
+        strategies._dropped.clear()
+
+    def test_tracked_ids(self):
+        ids = [ObjectId(), ObjectId()]
+        strategy = TrackedIdsStrategy()
+        strategy([(self.collection, ids)])
+        self.collection.delete_many.assert_called_once_with({"_id": {"$in": ids}})
+
+    def test_delete_all(self):
+        strategy = DeleteAllStrategy()
+        strategy([(self.collection, [ObjectId()])])
+        self.collection.delete_many.assert_called_once_with({})
+
+    def test_drop_recreates_indexes_on_next_use(self):
+        self.collection.index_information = Mock(return_value={
+            "_id_": {"key": [("_id", 1)], "v": 2},
+            "email_1": {"key": [("email", 1)], "unique": True, "v": 2, "ns": "test.users"}
+        })
+        strategy = DropStrategy()
+        strategy([(self.collection, [ObjectId()])])
+        self.collection.drop.assert_called_once_with()
+        self.assertFalse(self.collection.create_index.called)
+
+        prepare(self.collection)
+        prepare(self.collection)
+        self.collection.create_index.assert_called_once_with(
+            [("email", 1)], name="email_1", unique=True)
+
+    def test_drop_recreates_text_indexes(self):
+        weights = {"bio": 1, "name": 10}
+        self.collection.index_information = Mock(return_value={
+            "group_1_text": {"key": [("group", 1), ("_fts", "text"), ("_ftsx", 1)],
+                             "weights": weights, "default_language": "english",
+                             "language_override": "language", "textIndexVersion": 3,
+                             "v": 2}
+        })
+        DropStrategy()([(self.collection, [])])
+        prepare(self.collection)
+        key = self.collection.create_index.call_args[0][0]
+        self.assertEqual(("group", 1), key[0])
+        self.assertEqual(set([("bio", "text"), ("name", "text")]), set(key[1:]))
+        self.collection.create_index.assert_called_once_with(
+            key, name="group_1_text", weights=weights, default_language="english",
+            language_override="language", textIndexVersion=3)
+
+    def test_drop_caches_index_specs(self):
+        self.collection.index_information = Mock(return_value={})
+        strategy = DropStrategy()
+        strategy([(self.collection, [])])
+        strategy([(self.collection, [])])
+        self.assertEqual(1, len(self.collection.index_information.mock_calls))
+        self.assertEqual(2, len(self.collection.drop.mock_calls))
+
+    def test_timings(self):
+        strategy = DeleteAllStrategy()
+        self.assertIsNone(strategy.mean_time)
+        strategy([(self.collection, [])])
+        strategy([(self.collection, [])])
+        self.assertEqual(2, strategy.calls)
+        self.assertGreaterEqual(strategy.total_time, strategy.last_time)
+        self.assertIn("DeleteAllStrategy: 2 cleanups", str(strategy))
@@ -0,0 +1,106 @@
+from unittest import TestCase
+import monufacture
+from monufacture import factory, default, create_list, cleanup, reset, in_memory, get_factory
+from monufacture.tracking import IdTracker
+from monufacture import bulk
+from bson.objectid import ObjectId
+from mock import Mock
+
+
+class TestIdTracker(TestCase):
+
+    def setUp(self):
+        self.ids = [ObjectId() for i in range(25)]
+
+    def test_returns_ids_in_order(self):
+        tracker = IdTracker()
+        tracker.extend(self.ids[:10])
+        tracker.append(self.ids[10])
+        self.assertEqual(11, len(tracker))
+        self.assertEqual(self.ids[:11], list(tracker))
+
+    def test_packs_object_ids(self):
+        tracker = IdTracker()
+        tracker.extend(self.ids)
+        self.assertEqual(25 * 12, len(tracker.packed))
+        self.assertEqual([], tracker.others)
+
+    def test_other_ids_follow_object_ids(self):
+        tracker = IdTracker()
+        tracker.extend([1, self.ids[0], "two", self.ids[1]])
+        self.assertEqual([self.ids[0], self.ids[1], 1, "two"], list(tracker))
+        self.assertEqual(4, len(tracker))
+
+    def test_compares_with_lists(self):
+        tracker = IdTracker()
+        self.assertEqual([], tracker)
+        self.assertFalse(tracker)
+        tracker.extend(self.ids)
+        self.assertEqual(self.ids, tracker)
+        self.assertNotEqual(self.ids[:3], tracker)
+
+    def test_batches(self):
+        tracker = IdTracker()
+        tracker.extend(self.ids + [1, 2, 3])
+        batches = list(tracker.batches(10))
+        self.assertEqual([10, 10, 5, 3], [len(batch) for batch in batches])
+        self.assertEqual(self.ids + [1, 2, 3], sum(batches, []))
+
+    def test_spills_to_disk(self):
+        tracker = IdTracker(spill_bytes=10 * 12)
+        tracker.extend(self.ids)
+        self.assertEqual(20 * 12, tracker.spilled)
+        self.assertEqual(5 * 12, len(tracker.packed))
+        self.assertEqual(25, len(tracker))
+        self.assertEqual(self.ids, list(tracker))
+        self.assertEqual([7, 7, 7, 4], [len(batch) for batch in tracker.batches(7)])
+
+    def test_extend_from_tracker(self):
+        first = IdTracker(spill_bytes=12 * 4)
+        first.extend(self.ids[:10] + ["a"])
+        second = IdTracker()
+        second.extend(self.ids[10:])
+        second.extend(first)
+        self.assertEqual(self.ids[10:] + self.ids[:10] + ["a"], list(second))
+
+    def test_close(self):
+        tracker = IdTracker(spill_bytes=12)
+        tracker.extend(self.ids + [1])
+        tracker.close()
+        self.assertEqual(0, len(tracker))
+        self.assertEqual(None, tracker.file)
+
+    def test_delete_documents_reads_batches(self):
+        collection = Mock()
+        tracker = IdTracker(spill_bytes=12 * 8)
+        tracker.extend(self.ids)
+        bulk.delete_documents(collection, tracker, max_count=10)
+        self.assertEqual([self.ids[:10], self.ids[10:20], self.ids[20:]],
+                         [call[0][0]["_id"]["$in"] for call in collection.delete_many.call_args_list])
+
+
+class TestFactoryTracking(TestCase):
+
+    def setUp(self):
+        self.memory = in_memory()
+        monufacture.id_spill_bytes = 12 * 16
+        with factory("user", "users"):
+            default({"name": "Joe"})
+        monufacture.id_spill_bytes = None
+
+    def tearDown(self):
+        reset()
+        in_memory(False)
+
+    def test_spilled_ids_are_cleaned_up(self):
+        users = create_list(50, "user", bulk_=True)
+        created_ids = get_factory("user").created_ids
+        self.assertTrue(created_ids.spilled)
+        self.assertEqual([user["_id"] for user in users], created_ids)
+        self.assertEqual(50, len(self.memory["users"]))
+        cleanup()
+        self.assertEqual(0, len(self.memory["users"]))
+        self.assertEqual([], get_factory("user").created_ids)
+        # The tracker handed to the strategy is closed, removing its file.
+        self.assertIsNone(created_ids.file)
+        self.assertEqual(0, len(created_ids))
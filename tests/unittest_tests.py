@@ -4,6 +4,7 @@ from unittest import TestCase, TestLoader, TestResult
 from monufacture import factory, create, create_list, reset, default
 from monufacture.unittest import enable_factories
 from monufacture.helpers import dependent, sequence, id_of
+from monufacture.strategies import DeleteAllStrategy
 
 host = os.environ.get("DB_IP", "localhost")
 port = int(os.environ.get("DB_PORT", 27017))
@@ -32,6 +33,17 @@ class TestUnittestSupport(TestCase):
             self.assertEqual(user_collection.count(), 1)
             self.assertEqual("Joe", user['first'])
 
+    class StrategyTestCase(TestCase):
+        strategy = DeleteAllStrategy()
+
+        def __init__(self, *args, **kwargs):
+            super(TestUnittestSupport.StrategyTestCase, self).__init__(*args, **kwargs)
+            enable_factories(self, self.strategy)
+
+        def test_some_functionality(self):
+            create_list(3, "user")
+            self.assertEqual(user_collection.count(), 3)
+
     def setUp(self):
         with factory("user", user_collection):
             default({
@@ -64,3 +76,17 @@ class TestUnittestSupport(TestCase):
         self.assertTrue(result.wasSuccessful(), result)
         self.assertEquals(user_collection.count(), 0)
         self.assertEquals(company_collection.count(), 0)
+
+    def test_data_cleaned_up_with_strategy(self):
+        user_collection.remove()
+        company_collection.remove()
+        company_collection.insert({"name": "Not from a factory"})
+        loader = TestLoader()
+        suite = loader.loadTestsFromTestCase(TestUnittestSupport.StrategyTestCase)
+        result = TestResult()
+        suite.run(result)
+        self.assertTrue(result.wasSuccessful(), result)
+        self.assertEquals(1, TestUnittestSupport.StrategyTestCase.strategy.calls)
+        self.assertEquals(user_collection.count(), 0)
+        # DeleteAllStrategy empties whole collections, not just tracked ids.
+        self.assertEquals(company_collection.count(), 0)